@@ -0,0 +1,319 @@
+"""Offline benchmarks for the attendance bot.
+
+Drives the real handlers of toha.py (on_raw_reaction_add, reset_attendance_and_report,
+/누적출석 and /내출석) against stand-in guild, channel, message and interaction objects.
+Every REST call is answered locally after a simulated latency, so no network or token is
+needed. Data files are written to a temporary directory that is removed afterwards.
+
+Usage: python benchmark.py [--members 5000] [--backend json] [--rest-latency 0.05] [--storm 500]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+import types
+
+# Fixed clock for every run, so the weekday and its expected emoji never change
+BENCHMARK_TIME = datetime.datetime(2024, 5, 8, 12, 0)  # A Wednesday
+BOT_USER_ID = 1
+GUILD_ID = 1000
+CHANNEL_ID = 2000
+BOARD_MESSAGE_ID = 3000
+FIRST_MEMBER_ID = 10_000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks the attendance bot's handlers without Discord.")
+    parser.add_argument("--members", type=int, default=5000, help="members in the simulated guild")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="attendance storage backend")
+    parser.add_argument("--rest-latency", type=float, default=0.05, help="seconds each simulated REST call takes")
+    parser.add_argument("--storm", type=int, default=500, help="wrong-emoji reactions in the storm, removed one REST call each")
+    parser.add_argument("--commands", type=int, default=200, help="concurrent invocations of each slash command")
+    parser.add_argument("--reports", type=int, default=3, help="weekly reports to generate")
+    return parser.parse_args()
+
+def import_bot(backend):
+    """Imports toha.py with the given backend, making sure it never starts the real bot."""
+    os.environ.pop("DISCORD_BOT_TOKEN", None)
+    os.environ["ATTENDANCE_BACKEND"] = backend
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with contextlib.redirect_stdout(io.StringIO()):  # Silences the missing token message
+        import toha
+    return toha
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def bytes_written():
+    """Returns the bytes this process has written so far, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+class LoopMonitor:
+    """Measures how long the event loop was blocked, by how late a short sleep wakes up."""
+
+    INTERVAL = 0.005
+
+    def __init__(self):
+        self.blocked = 0.0
+        self.max_blocked = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.INTERVAL)
+            late = time.perf_counter() - started - self.INTERVAL
+            if late > self.INTERVAL:
+                self.blocked += late
+                self.max_blocked = max(self.max_blocked, late)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._task.cancel()
+
+class FakeRest:
+    """Answers REST calls after a fixed latency and counts them."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.removed = {}  # user_id -> time the reaction was removed
+
+    async def call(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def remove_reaction(self, channel_id, message_id, emoji, member_id):
+        await self.call()
+        self.removed[member_id] = time.perf_counter()
+
+class FakeMessage:
+    def __init__(self, message_id, channel, embeds):
+        self.id = message_id
+        self.channel = channel
+        self.embeds = embeds
+        self.reactions = []
+
+    async def add_reaction(self, emoji):
+        await self.channel.rest.call()
+
+    async def fetch(self):
+        await self.channel.rest.call()
+        return self
+
+class FakeChannel:
+    def __init__(self, rest, guild):
+        self.id = CHANNEL_ID
+        self.guild = guild
+        self.rest = rest
+        self.sent = 0
+        self.messages = []  # Every FakeMessage sent, in order
+
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        await self.rest.call()
+        self.sent += 1
+        message = FakeMessage(BOARD_MESSAGE_ID + self.sent, self, embeds or [embed])
+        self.messages.append(message)
+        return message
+
+class FakeGuild:
+    def __init__(self, members, rest):
+        self.id = GUILD_ID
+        self.members = members
+        self.channel = FakeChannel(rest, self)
+
+    def get_channel(self, channel_id):
+        return self.channel
+
+    def get_member(self, member_id):
+        return None
+
+class FakeInteraction:
+    """The parts of discord.Interaction the slash commands use."""
+
+    def __init__(self, interaction_id, guild, user, rest):
+        self.id = interaction_id
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.response = types.SimpleNamespace(defer=self._defer)
+        self.followup = types.SimpleNamespace(send=self._send)
+        self.rest = rest
+        self.sent = 0
+
+    async def _defer(self, **kwargs):
+        await self.rest.call()
+
+    async def _send(self, content=None, **kwargs):
+        await self.rest.call()
+        self.sent += 1
+
+def make_member(member_id):
+    return types.SimpleNamespace(
+        id=member_id, bot=False, display_name=f"멤버{member_id}", avatar=None, mention=f"<@{member_id}>"
+    )
+
+class Benchmark:
+    def __init__(self, toha, args):
+        self.toha = toha
+        self.args = args
+        self.rest = FakeRest(args.rest_latency)
+        self.members = [make_member(FIRST_MEMBER_ID + i) for i in range(args.members)]
+        self.guild = FakeGuild(self.members, self.rest)
+        self.results = []
+
+    def setup(self):
+        toha = self.toha
+        toha.bot._connection.user = types.SimpleNamespace(id=BOT_USER_ID, avatar=None)
+        toha.bot.http.remove_reaction = self.rest.remove_reaction
+        toha.set_clock(toha.FixedClock(BENCHMARK_TIME.replace(tzinfo=toha.TIMEZONE)))
+        toha.attendance_store.load()
+        toha.attendance_store.start()
+        toha.start_reaction_workers()
+        board = toha.guild_boards(self.guild)[toha.MAIN_BOARD]
+        board.attach(FakeMessage(BOARD_MESSAGE_ID, self.guild.channel, []), toha.week_start_of(BENCHMARK_TIME.date()))
+
+        # Time each reaction from dispatch until its batch is persisted
+        self.reaction_latencies = []
+        process_reactions = toha.process_reactions
+
+        async def timed_process_reactions(batch):
+            await process_reactions(batch)
+            finished = time.perf_counter()
+            self.reaction_latencies.extend(finished - payload.dispatched for payload, *_ in batch)
+
+        toha.process_reactions = timed_process_reactions
+
+    def payload(self, member, emoji):
+        return types.SimpleNamespace(
+            guild_id=self.guild.id, channel_id=CHANNEL_ID, message_id=BOARD_MESSAGE_ID,
+            user_id=member.id, member=member, emoji=emoji, dispatched=time.perf_counter()
+        )
+
+    async def flush(self):
+        """Persists whatever the JSON store still holds in memory, so its writes are counted."""
+        partitions = getattr(self.toha.attendance_store, "partitions", {})
+        await asyncio.gather(*(partition.flush() for partition in partitions.values()))
+
+    async def measure(self, name, run):
+        """Runs a scenario and records its operation count, latencies, loop blocking and bytes written."""
+        written = bytes_written()
+        with LoopMonitor() as monitor:
+            started = time.perf_counter()
+            count, latencies = await run()
+            elapsed = time.perf_counter() - started
+        written_after = bytes_written()
+        self.results.append({
+            "name": name,
+            "count": count,
+            "elapsed": elapsed,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "blocked": monitor.blocked,
+            "max_blocked": monitor.max_blocked,
+            "written": None if written is None else written_after - written,
+        })
+
+    async def correct_reactions(self):
+        toha = self.toha
+        emoji = toha.discord.PartialEmoji.from_str(toha.weekdays_emojis["Wed"])
+        self.reaction_latencies = []
+        await asyncio.gather(*(toha.on_raw_reaction_add(self.payload(member, emoji)) for member in self.members))
+        await toha.reaction_queue.join()
+        await self.flush()
+        return len(self.members), self.reaction_latencies
+
+    async def wrong_reaction_storm(self):
+        toha = self.toha
+        emojis = [toha.discord.PartialEmoji.from_str(toha.weekdays_emojis[day]) for day in ("Mon", "Tue", "Thu")]
+        self.rest.removed = {}
+        payloads = [
+            self.payload(self.members[index % len(self.members)], emojis[index % len(emojis)])
+            for index in range(self.args.storm)
+        ]
+        await asyncio.gather(*(toha.on_raw_reaction_add(payload) for payload in payloads))
+        await toha.reaction_queue.join()
+        # Removals are queued behind the scheduler; wait until every storming member's reaction is gone
+        while len(self.rest.removed) < len({payload.user_id for payload in payloads}):
+            await asyncio.sleep(0.01)
+        dispatched = {}
+        for payload in payloads:
+            dispatched.setdefault(payload.user_id, payload.dispatched)
+        latencies = [removed - dispatched[user_id] for user_id, removed in self.rest.removed.items()]
+        return len(payloads), latencies
+
+    async def weekly_reports(self):
+        latencies = []
+        for _ in range(self.args.reports):
+            started = time.perf_counter()
+            await self.toha.reset_attendance_and_report(self.guild)
+            latencies.append(time.perf_counter() - started)
+        return self.args.reports, latencies
+
+    async def run_command(self, command):
+        async def invoke(index):
+            user = self.members[index % len(self.members)]
+            interaction = FakeInteraction(index, self.guild, user, self.rest)
+            started = time.perf_counter()
+            await command.callback(interaction)
+            return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(invoke(index) for index in range(self.args.commands)))
+        return self.args.commands, list(latencies)
+
+    async def run(self):
+        self.setup()
+        await self.measure("reactions (correct emoji)", self.correct_reactions)
+        await self.measure("reactions (wrong emoji storm)", self.wrong_reaction_storm)
+        await self.measure("/누적출석", lambda: self.run_command(self.toha.show_cumulative))
+        await self.measure("/내출석", lambda: self.run_command(self.toha.my_attendance))
+        await self.measure("weekly report", self.weekly_reports)
+
+    def print_results(self):
+        print(
+            f"{self.args.members} members, {self.args.backend} backend, "
+            f"{self.args.rest_latency * 1000:.0f}ms simulated REST latency, {self.rest.calls} REST calls"
+        )
+        header = f"{'scenario':<32}{'ops':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'blocked ms':>12}{'max block ms':>14}{'written KiB':>13}"
+        print(header)
+        print("-" * len(header))
+        for result in self.results:
+            written = "n/a" if result["written"] is None else f"{result['written'] / 1024:.1f}"
+            print(
+                f"{result['name']:<32}{result['count']:>8}{result['count'] / result['elapsed']:>10.1f}"
+                f"{result['p50'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}"
+                f"{result['blocked'] * 1000:>12.1f}{result['max_blocked'] * 1000:>14.1f}{written:>13}"
+            )
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="toha-benchmark-") as data_dir:
+        toha = import_bot(args.backend)
+        os.chdir(data_dir)  # Keep the benchmark's data files away from the real ones
+        benchmark = Benchmark(toha, args)
+        try:
+            asyncio.run(benchmark.run())
+        finally:
+            toha.attendance_store.close()
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        benchmark.print_results()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Accelerated virtual-time simulation of the attendance bot.
+
+Runs the real weekly scheduler of toha.py under a virtual clock, so each rollover,
+weekly report and board fires at its scheduled time while weeks pass in fractions of a
+second. A seeded population of stand-in members reacts to the board every day, some
+with the wrong emoji or twice. Every weekly report is checked against the attendance the
+population actually made, and the data directory's size is tracked as the weeks go by.
+
+Usage: python simulate.py [--weeks 52] [--members 200] [--backend json] [--seed 1]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import types
+
+from benchmark import FIRST_MEMBER_ID, FakeGuild, FakeRest, import_bot, make_member
+
+REPORT_TITLE = "📊 **주간 출석 통계**"
+REPORT_VALUE = re.compile(r"📅 이번 주: (\d+)일\n📈 총 출석: (\d+)일")
+REACTION_HOUR = 12  # Local hour at which the population reacts each day
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replays weeks of attendance in virtual time and checks every report.")
+    parser.add_argument("--weeks", type=int, default=52, help="weeks to simulate")
+    parser.add_argument("--members", type=int, default=200, help="members in the simulated guild")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="attendance storage backend")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=datetime.date(2025, 1, 6),
+                        help="first simulated day, moved back to its Monday")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the simulated population")
+    parser.add_argument("--wrong-rate", type=float, default=0.05, help="chance a member also reacts with a wrong emoji")
+    parser.add_argument("--repeat-rate", type=float, default=0.05, help="chance a member reacts twice on a day")
+    parser.add_argument("--every", type=int, default=4, help="weeks between storage growth rows")
+    return parser.parse_args()
+
+def data_size(directory):
+    """Returns the total size in bytes of the files under the directory."""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while walking, e.g. a temporary file being replaced
+    return total
+
+class Simulation:
+    def __init__(self, toha, args, data_dir):
+        self.toha = toha
+        self.args = args
+        self.data_dir = data_dir
+        self.random = random.Random(args.seed)
+        self.rest = FakeRest(0)
+        self.members = [make_member(FIRST_MEMBER_ID + i) for i in range(args.members)]
+        self.names = {member.display_name: member.id for member in self.members}
+        # Each member attends on a day with their own probability
+        self.presence = {member.id: self.random.uniform(0.1, 0.95) for member in self.members}
+        self.guild = FakeGuild(self.members, self.rest)
+        self.start = datetime.datetime.combine(args.start, datetime.time(), toha.TIMEZONE)
+        self.start -= datetime.timedelta(days=self.start.weekday())
+        self.weekly = {}  # week_start -> {user_id: days attended}
+        self.cumulative = {}  # user_id -> days attended
+        self.reactions = 0
+        self.reports = []  # Week starts of the reports checked, in order
+        self.mismatches = []
+        self.growth = []  # (weeks, bytes)
+        self.checked = 0  # Channel messages already looked at
+
+    def setup(self):
+        toha = self.toha
+        toha.bot._connection.user = types.SimpleNamespace(id=1, avatar=None)
+        toha.bot.http.remove_reaction = self.rest.remove_reaction
+        toha.bot.get_guild = lambda guild_id: self.guild if guild_id == self.guild.id else None
+        toha.REACTION_BATCH_WINDOW = 0  # Batches would otherwise wait in real time
+        self.clock = toha.VirtualClock(self.start + datetime.timedelta(seconds=1))
+        toha.set_clock(self.clock)
+        toha.attendance_store.load()
+        toha.attendance_store.start()
+        toha.start_reaction_workers()
+
+    def payload(self, member, emoji):
+        board = self.toha.guild_boards(self.guild)[self.toha.MAIN_BOARD].message
+        return types.SimpleNamespace(
+            guild_id=self.guild.id, channel_id=board.channel.id, message_id=board.id,
+            user_id=member.id, member=member, emoji=emoji
+        )
+
+    async def react(self, day):
+        """Has the population react to the board on the given day, recording what should count."""
+        toha = self.toha
+        emojis = {name: toha.discord.PartialEmoji.from_str(emoji) for name, emoji in toha.weekdays_emojis.items()}
+        today = list(emojis)[day.weekday()]
+        week = self.weekly.setdefault(day - datetime.timedelta(days=day.weekday()), {})
+        payloads = []
+        for member in self.members:
+            if self.random.random() < self.args.wrong_rate:
+                wrong = self.random.choice([name for name in emojis if name != today])
+                payloads.append(self.payload(member, emojis[wrong]))
+            if self.random.random() >= self.presence[member.id]:
+                continue
+            payloads.append(self.payload(member, emojis[today]))
+            if self.random.random() < self.args.repeat_rate:
+                payloads.append(self.payload(member, emojis[today]))
+            week[member.id] = week.get(member.id, 0) + 1
+            self.cumulative[member.id] = self.cumulative.get(member.id, 0) + 1
+        self.random.shuffle(payloads)
+        await asyncio.gather(*(toha.on_raw_reaction_add(payload) for payload in payloads))
+        await toha.reaction_queue.join()
+        self.reactions += len(payloads)
+
+    def check_reports(self, week_start, cumulative):
+        """Checks the report pages sent since the last call against the expected attendance."""
+        messages = self.guild.channel.messages[self.checked:]
+        self.checked = len(self.guild.channel.messages)
+        reported = {}
+        for message in messages:
+            if message.embeds[0].title != REPORT_TITLE:
+                continue  # A board; every report message starts with the titled embed
+            for embed in message.embeds:
+                for field in embed.fields:
+                    match = REPORT_VALUE.fullmatch(field.value)
+                    user_id = self.names.get(field.name)
+                    if match is None or user_id is None:
+                        self.mismatches.append(f"{week_start}: unexpected field {field.name!r}: {field.value!r}")
+                        continue
+                    reported[user_id] = (int(match[1]), int(match[2]))
+        if not reported:
+            self.mismatches.append(f"{week_start}: no report was sent")
+            return
+        self.reports.append(week_start)
+        week = self.weekly.get(week_start, {})
+        for member in self.members:
+            expected = (week.get(member.id, 0), cumulative.get(member.id, 0))
+            actual = reported.get(member.id)
+            if actual != expected:
+                self.mismatches.append(f"{week_start}: {member.display_name} reported {actual}, expected {expected}")
+
+    async def flush(self):
+        """Persists whatever the JSON store still holds in memory, so the data size is current."""
+        partitions = getattr(self.toha.attendance_store, "partitions", {})
+        await asyncio.gather(*(partition.flush() for partition in partitions.values()))
+
+    async def run(self):
+        self.setup()
+        toha = self.toha
+        toha.start_weekly_scheduler(self.guild.id)
+        scheduler = toha.weekly_scheduler_tasks[self.guild.id]
+        await self.clock.settle(scheduler)  # Posts the first board
+        for week in range(self.args.weeks):
+            week_start = self.start + datetime.timedelta(weeks=week)
+            for offset in range(7):
+                day = week_start + datetime.timedelta(days=offset)
+                await self.clock.advance(day.replace(hour=REACTION_HOUR))
+                await self.react(day.date())
+            # Cumulative counts as of the end of this week, before the next week's reactions
+            cumulative = dict(self.cumulative)
+            await self.clock.advance(week_start + datetime.timedelta(weeks=1, minutes=1))
+            if scheduler.done():
+                scheduler.result()  # Raises whatever stopped the scheduler
+            self.check_reports(week_start.date(), cumulative)
+            if (week + 1) % self.args.every == 0 or week + 1 == self.args.weeks:
+                await self.flush()
+                self.growth.append((week + 1, data_size(self.data_dir)))
+        toha.stop_weekly_scheduler(self.guild.id)
+
+    def print_results(self, elapsed):
+        print(
+            f"{self.args.weeks} weeks from {self.start.date()} in {elapsed:.2f}s, {self.args.members} members, "
+            f"{self.args.backend} backend, {self.reactions} reactions, {self.rest.calls} REST calls"
+        )
+        print(f"{len(self.reports)}/{self.args.weeks} weekly reports checked, {len(self.mismatches)} mismatches")
+        for mismatch in self.mismatches[:20]:
+            print(f"  {mismatch}")
+        header = f"{'weeks':>6}{'data KiB':>12}{'KiB/week':>12}"
+        print(header)
+        print("-" * len(header))
+        previous_weeks, previous_size = 0, 0
+        for weeks, size in self.growth:
+            per_week = (size - previous_size) / (weeks - previous_weeks) / 1024
+            print(f"{weeks:>6}{size / 1024:>12.1f}{per_week:>12.1f}")
+            previous_weeks, previous_size = weeks, size
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="toha-simulation-") as data_dir:
+        toha = import_bot(args.backend)
+        os.chdir(data_dir)  # Keep the simulation's data files away from the real ones
+        simulation = Simulation(toha, args, data_dir)
+        try:
+            started = time.perf_counter()
+            asyncio.run(simulation.run())
+            elapsed = time.perf_counter() - started
+        finally:
+            toha.attendance_store.close()
+            os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        simulation.print_results(elapsed)
+    sys.exit(1 if simulation.mismatches or len(simulation.reports) < args.weeks else 0)
+
+if __name__ == "__main__":
+    main()
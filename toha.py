@@ -1,10 +1,29 @@
 import discord
-from discord.ext import tasks
 from discord import app_commands
 import asyncio
+import bisect
+import collections
+import contextlib
+import csv
 import datetime
+import functools
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import logging
+import mmap
 import os
+import signal
+import sqlite3
+import struct
+import threading
+import time
+import unicodedata
+from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
 
 # Initialize bot intents
 intents = discord.Intents.default()
@@ -14,11 +33,32 @@ intents.message_content = True
 intents.reactions = True
 intents.guilds = True
 
-# Create bot instance without a command prefix
-bot = discord.Client(intents=intents)
-tree = app_commands.CommandTree(bot)
+class MeteredCommandTree(app_commands.CommandTree):
+    """A command tree that notes when each slash command starts, so its latency can be recorded."""
 
-# Channel ID where attendance messages will be sent
+    async def interaction_check(self, interaction):
+        command_started[interaction.id] = time.perf_counter()
+        return True
+
+# Set LOW_MEMORY_MODE to run without the member cache: guilds are not chunked at startup, and
+# listings only show members with attendance, resolving their names on demand
+LOW_MEMORY_MODE = bool(os.getenv("LOW_MEMORY_MODE"))
+# Rate limits longer than this many seconds (30 at least) are raised to the REST scheduler, which
+# waits them out without holding a concurrency slot; discord.py sleeps through shorter ones itself
+REST_MAX_RATELIMIT_TIMEOUT = float(os.getenv("REST_MAX_RATELIMIT_TIMEOUT", "30"))
+client_options = {"max_ratelimit_timeout": REST_MAX_RATELIMIT_TIMEOUT}
+if LOW_MEMORY_MODE:
+    client_options.update(chunk_guilds_at_startup=False, member_cache_flags=discord.MemberCacheFlags.none())
+
+# Create bot instance without a command prefix. Set BOT_SHARDED to let discord.py
+# spread the guilds over as many shards as Discord recommends.
+if os.getenv("BOT_SHARDED"):
+    bot = discord.AutoShardedClient(intents=intents, **client_options)
+else:
+    bot = discord.Client(intents=intents, **client_options)
+tree = MeteredCommandTree(bot)
+
+# Default channel ID where attendance messages will be sent. Each guild can pick its own with /출석채널.
 channel_id = 1312012147579944960  # Replace with your actual channel ID
 
 # Mapping of weekdays to their respective emoji
@@ -32,398 +72,2718 @@ weekdays_emojis = {
     "Sun": '<:007:1312343758355828769>'   
 }
 
-# Attendance JSON file paths
-ATTENDANCE_FILE = "attendance.json"
-CUMULATIVE_ATTENDANCE_FILE = "cumulative_attendance.json"
+# Name of the board every guild has, posted in its attendance channel with weekdays_emojis.
+# More boards, each with its own channel and emojis, can be added with /출석보드추가.
+MAIN_BOARD = "기본"
+
+# Attendance storage backend: "json" (snapshot + journal files) or "sqlite"
+STORAGE_BACKEND = os.getenv("ATTENDANCE_BACKEND", "json")
+SQLITE_FILE = os.getenv("ATTENDANCE_DB_FILE", "attendance.db")
+
+# JSON backend: per guild, a snapshot of the full state plus an append-only journal
+# of the events recorded since that snapshot was written, in GUILD_DATA_DIR/<guild_id>/
+GUILD_DATA_DIR = os.getenv("ATTENDANCE_DATA_DIR", "guilds")
+SNAPSHOT_FILE = "attendance_snapshot.json"
+JOURNAL_FILE = "attendance_journal.jsonl"
+# Append-only archive of every finished week, stored next to the guild's data, and its ISO week index
+ARCHIVE_FILE = "attendance_archive.bin"
+ARCHIVE_INDEX_FILE = "attendance_archive.idx"
+
+# Legacy single-guild files, only read to migrate existing data into the first guild.
+# The snapshot and journal file names above were also used at the top level.
+ATTENDANCE_FILE = "attendance.json"
+CUMULATIVE_ATTENDANCE_FILE = "cumulative_attendance.json"
+
+# How often (in seconds) the background flusher compacts a journal past COMPACT_THRESHOLD and
+# retries appends that failed. Each batch of attendance is journaled as soon as it is recorded.
+FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "30"))
+
+# Number of journaled events after which the journal is compacted into a new snapshot
+COMPACT_THRESHOLD = int(os.getenv("ATTENDANCE_COMPACT_THRESHOLD", "1000"))
+
+# SQLite backend: number of read-only connections serving queries next to the single writer
+SQLITE_READERS = int(os.getenv("ATTENDANCE_DB_READERS", "4"))
+
+# Lock waits (in seconds) longer than this are logged
+LOCK_WAIT_WARNING = float(os.getenv("LOCK_WAIT_WARNING", "1"))
+
+# Queue of reaction events waiting for the reaction workers. When it is full, the
+# gateway handler waits for room instead of dropping attendance.
+REACTION_QUEUE_SIZE = int(os.getenv("REACTION_QUEUE_SIZE", "10000"))
+REACTION_WORKERS = int(os.getenv("REACTION_WORKERS", "1"))
+# How long (in seconds) a worker gathers reaction events into one batch
+REACTION_BATCH_WINDOW = float(os.getenv("REACTION_BATCH_WINDOW", "0.5"))
+# How long (in seconds) a weekly report waits for queued reactions to be recorded first
+REACTION_DRAIN_TIMEOUT = float(os.getenv("REACTION_DRAIN_TIMEOUT", "10"))
+reaction_queue = asyncio.Queue(maxsize=REACTION_QUEUE_SIZE)
+reaction_workers = []
+
+# Outbound REST calls: priorities (lower runs first), how many calls may be in flight
+# at once, how often a rate-limited or failed call is retried, and the queue wait
+# (in seconds) after which a bucket is reported as throttled
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BOARD = 1
+PRIORITY_CLEANUP = 2
+REST_CONCURRENCY = int(os.getenv("REST_CONCURRENCY", "4"))
+REST_MAX_RETRIES = int(os.getenv("REST_MAX_RETRIES", "3"))
+REST_BACKOFF_BASE = float(os.getenv("REST_BACKOFF_BASE", "1"))
+REST_WAIT_WARNING = float(os.getenv("REST_WAIT_WARNING", "5"))
+
+# Discord embed limits used when paginating long member lists
+EMBED_MAX_FIELDS = 25
+MESSAGE_MAX_EMBEDS = 10
+MESSAGE_MAX_EMBED_CHARS = 6000  # Across all embeds of one message
+FIELD_NAME_MAX = 256
+FIELD_VALUE_MAX = 1024
+
+# First day covered by the per-user attendance bitmaps. A Monday, so bit i always falls on weekday i % 7.
+BITMAP_EPOCH = datetime.date(2020, 1, 6)
+
+# Members fetched per page while streaming an export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+# Upper bounds, in seconds, of the latency histogram buckets
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Local address of the Prometheus metrics endpoint, which is only served if METRICS_PORT is set
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Rendered output kept for reuse while the data is unchanged: /누적출석 listings (one per guild)
+# and, separately, /내출석 embeds (one per member), this many of each
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+# Worker threads that build weekly reports, listings and statistics off the event loop
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+
+# Display names resolved in low-memory mode: how many are kept, for how long (in seconds),
+# and how many are asked for per gateway request (Discord allows up to 100)
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "10000"))
+NAME_CACHE_TTL = float(os.getenv("NAME_CACHE_TTL", "3600"))
+NAME_QUERY_BATCH = 100
+
+# Default timezone in which weeks start (Monday 00:00), and the file remembering each guild's
+# last rollover, so a restart never posts a second board or report for the same week
+TIMEZONE = ZoneInfo(os.getenv("ATTENDANCE_TIMEZONE", "Asia/Seoul"))
+ROLLOVER_STATE_FILE = "rollover_state.json"
+# Per-guild settings: board channel and timezone
+GUILD_CONFIG_FILE = "guild_config.json"
+# File caching the fingerprint of the last synced slash command tree. Set FORCE_COMMAND_SYNC
+# to sync on startup even if the commands did not change.
+COMMAND_SYNC_FILE = "command_sync.json"
+FORCE_COMMAND_SYNC = bool(os.getenv("FORCE_COMMAND_SYNC"))
+# File recording when the bot was last alive, and how often (in seconds) it is updated.
+# On startup, reactions made on the boards since then are reconciled.
+HEARTBEAT_FILE = "heartbeat.json"
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "300"))
+# Seconds to wait before retrying a weekly board that failed to post
+ROLLOVER_RETRY_DELAY = float(os.getenv("ROLLOVER_RETRY_DELAY", "60"))
+
+# Variables for testing and tracking weeks
+boards = {}  # guild_id -> {board name: Board}, the main board first
+board_messages = {}  # message_id -> Board it is the current message of; the reaction dispatch index
+member_indexes = {}  # guild_id -> MemberIndex of its non-bot members
+week_archives = {}  # guild_id -> WeekArchive
+weekly_scheduler_tasks = {}  # guild_id -> weekly scheduler task
+rollover_replans = {}  # guild_id -> event set to make its scheduler re-plan the next wakeup
+last_alive = None  # When the previous run was last known to be alive, read once at startup
+startup_done = False  # on_ready fires again after reconnects; startup work runs once per process
+heartbeat_task = None
+command_started = {}  # interaction_id -> when its slash command was dispatched
+
+class SystemClock:
+    """The system's time. Waits take real time."""
+
+    def now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    async def wait(self, event, timeout):
+        """Waits until the event is set or the timeout (in seconds) has passed."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
+
+class FixedClock(SystemClock):
+    """A clock stopped at a set time, for /시간설정. Waits still take real time."""
+
+    def __init__(self, moment):
+        self.moment = moment
+
+    def now(self):
+        return self.moment
+
+class VirtualClock:
+    """Simulated time that only moves when advanced, for replaying weeks in seconds.
+
+    advance() jumps to each wait's deadline in turn and lets the woken task run until it
+    waits on the clock again, or finishes, before jumping to the next one.
+    """
+
+    def __init__(self, start):
+        self.moment = start
+        self._waits = []  # Heap of (deadline, order, future, task)
+        self._order = itertools.count()
+
+    def now(self):
+        return self.moment
+
+    async def wait(self, event, timeout):
+        """Waits until the event is set or the clock is advanced past the timeout."""
+        deadline = self.moment + datetime.timedelta(seconds=max(timeout, 0))
+        woken = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waits, (deadline, next(self._order), woken, asyncio.current_task()))
+        event_wait = asyncio.ensure_future(event.wait())
+        try:
+            await asyncio.wait({woken, event_wait}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            event_wait.cancel()
+            woken.cancel()  # A wait ended by its event is skipped when its deadline comes up
+
+    def waiting(self, task):
+        return any(waiter is task and not woken.done() for _, _, woken, waiter in self._waits)
+
+    async def settle(self, task):
+        """Lets the task run until it waits on the clock or finishes."""
+        await asyncio.sleep(0)
+        while not task.done() and not self.waiting(task):
+            await asyncio.sleep(0.001)  # Real time, for its disk and thread work
+
+    async def advance(self, until):
+        """Moves the clock forward to the given time, waking the waits it passes in order."""
+        while self._waits and self._waits[0][0] <= until:
+            deadline, _, woken, task = heapq.heappop(self._waits)
+            if woken.done():
+                continue
+            self.moment = max(self.moment, deadline)
+            woken.set_result(None)
+            await self.settle(task)
+        self.moment = max(self.moment, until)
+
+clock = SystemClock()
+
+def set_clock(new_clock):
+    """Replaces the clock behind get_current_time and re-plans the weekly rollovers against it."""
+    global clock
+    clock = new_clock
+    replan_rollovers()
+
+def get_current_time(tz=None):
+    """Returns the clock's current time in the given timezone (TIMEZONE by default)."""
+    return clock.now().astimezone(tz or TIMEZONE)
+
+def get_start_end_dates_previous_week(now=None):
+    """Returns the start and end dates of the previous week."""
+    if now is None:
+        now = get_current_time()
+    start_date = now - datetime.timedelta(days=now.weekday() + 7)  # Last Monday
+    end_date = start_date + datetime.timedelta(days=6)  # Last Sunday
+    return f"{start_date.year}년 {start_date.month}월 {start_date.day}일 월요일 ~ {end_date.year}년 {end_date.month}월 {end_date.day}일 일요일"
+
+def week_start_of(date):
+    """Returns the Monday of the week containing the given date."""
+    return date - datetime.timedelta(days=date.weekday())
+
+def empty_attendance():
+    """Returns an empty weekly attendance mapping with one set of user IDs per day."""
+    return {day: set() for day in weekdays_emojis.keys()}
+
+class Histogram:
+    """Counts observations into the METRICS_BUCKETS, Prometheus style."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)  # The last one counts everything above the largest bound
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(METRICS_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.buckets, histogram.count, histogram.sum = list(self.buckets), self.count, self.sum
+        return histogram
+
+    def quantile(self, fraction):
+        """Returns the upper bound of the bucket holding the given fraction of observations."""
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(METRICS_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """Counters, gauges and latency histograms keyed by name and labels. Safe to update from worker threads."""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def total(self, name):
+        """Returns the sum of a counter over all its labels."""
+        with self._lock:
+            return sum(value for (metric, _), value in self.counters.items() if metric == name)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observes how long the block took into the name_seconds histogram, counting name_errors_total if it raised."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count(f"{name.removesuffix('_seconds')}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        def label_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(
+                '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in pairs
+            ) + "}"
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, histogram.copy()) for key, histogram in self.histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{label_text(labels)} {value}")
+        for (name, labels), value in gauges:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{label_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip([*METRICS_BUCKETS, "+Inf"], histogram.buckets):
+                cumulative += count
+                lines.append(f"{name}_bucket{label_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class RateLimitCounter(logging.Handler):
+    """Counts the 429s discord.py reports, including the ones it retries without the REST scheduler seeing them."""
+
+    def emit(self, record):
+        if "responded with 429" in str(record.msg):
+            metrics.count("toha_rest_rate_limited_total")
+
+logging.getLogger("discord.http").addHandler(RateLimitCounter())
+
+def timed(handler):
+    """Decorates a coroutine function to record its latency as toha_handler_seconds{handler=...}."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with metrics.timer("toha_handler_seconds", handler=handler):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def read_json_file(path, default):
+    """Reads a JSON file. Returns the default if it is missing, and moves it aside if it is corrupted."""
+    if not os.path.exists(path):
+        return default
+    with metrics.timer("toha_disk_seconds", operation="read", file=os.path.basename(path)):
+        with open(path, "rb") as f:
+            data = f.read()
+        metrics.count("toha_disk_read_bytes_total", len(data), file=os.path.basename(path))
+        try:
+            return json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"Corrupted JSON file {path}: {e}")
+    # Keep the corrupted file around for manual recovery instead of overwriting it
+    os.replace(path, f"{path}.corrupt")
+    return default
+
+def write_json_file(path, data):
+    """Atomically writes data to a JSON file by replacing it with a fully written temporary file."""
+    tmp_path = f"{path}.tmp"
+    with metrics.timer("toha_disk_seconds", operation="write", file=os.path.basename(path)):
+        encoded = json.dumps(data, ensure_ascii=False, indent=4).encode("utf-8")
+        with open(tmp_path, "wb") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    metrics.count("toha_disk_write_bytes_total", len(encoded), file=os.path.basename(path))
+
+class WaitStats:
+    """Counts how often something was waited for, and for how long in total and at most.
+
+    Safe to update from worker threads, such as the SQLite reader and writer threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, wait):
+        with self._lock:
+            self.count += 1
+            self.total += wait
+            self.max = max(self.max, wait)
+        metrics.observe("toha_lock_wait_seconds", wait, lock=self.name)
+        if wait > LOCK_WAIT_WARNING:
+            print(f"Waited {wait:.2f}s for {self.name}")
+
+lock_wait_stats = {}  # name -> WaitStats, shared by every lock of the same kind
+
+def wait_stats(name):
+    """Returns the wait statistics registered under the name, creating them on first use."""
+    stats = lock_wait_stats.get(name)
+    if stats is None:
+        stats = lock_wait_stats[name] = WaitStats(name)
+    return stats
+
+class TimedLock:
+    """An asyncio.Lock that records how long acquirers wait for it."""
+
+    def __init__(self, name):
+        self._lock = asyncio.Lock()
+        self.stats = wait_stats(name)
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        await self._lock.acquire()
+        self.stats.add(time.perf_counter() - started)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._lock.release()
+
+class GuildStateFile:
+    """A small JSON file holding a dict of settings per guild, cached in memory."""
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._lock = TimedLock(f"state file {path}")  # Serializes writes of the file
+
+    def load(self, legacy_guild_id=None):
+        """Reads the file. Top-level settings from the single-guild layout move under legacy_guild_id."""
+        if self._data is None:
+            data = read_json_file(self.path, {})
+            legacy = {key: value for key, value in data.items() if not key.isdigit()}
+            self._data = {key: value for key, value in data.items() if key.isdigit()}
+            if legacy and legacy_guild_id is not None:
+                self._data[str(legacy_guild_id)] = {**legacy, **self._data.get(str(legacy_guild_id), {})}
+        return self._data
+
+    def get(self, guild_id):
+        """Returns a copy of the guild's settings."""
+        return dict(self.load().get(str(guild_id), {}))
+
+    async def update(self, guild_id, **updates):
+        """Updates the guild's settings and persists the file off the event loop."""
+        data = self.load()
+        data.setdefault(str(guild_id), {}).update(updates)
+        snapshot = {key: dict(value) for key, value in data.items()}
+        async with self._lock:
+            await asyncio.to_thread(write_json_file, self.path, snapshot)
+
+rollover_states = GuildStateFile(ROLLOVER_STATE_FILE)
+guild_configs = GuildStateFile(GUILD_CONFIG_FILE)
+
+def guild_timezone(guild_id):
+    """Returns the timezone in which the guild's weeks start."""
+    name = guild_configs.get(guild_id).get("timezone")
+    return ZoneInfo(name) if name else TIMEZONE
+
+def get_board_channel(guild):
+    """Returns the guild's attendance channel: the one set with /출석채널, else the default channel if it is in this guild."""
+    configured = guild_configs.get(guild.id).get("channel_id")
+    return guild.get_channel(configured or channel_id)
+
+def legacy_guild_id():
+    """Returns the guild that owns data from the single-guild layout: the one with the default channel, else the first."""
+    channel = bot.get_channel(channel_id)
+    if channel is not None and getattr(channel, "guild", None) is not None:
+        return channel.guild.id
+    return bot.guilds[0].id if bot.guilds else None
+
+class AttendanceRanking:
+    """Users ordered by cumulative attendance, kept sorted as counts increment.
+
+    A count change moves one entry instead of re-sorting everyone, the top k are a slice,
+    and a user's rank is a binary search. Ties share a rank.
+    """
+
+    def __init__(self, counts=()):
+        self.counts = dict(counts)  # user_id -> cumulative count
+        self._order = sorted((-count, user_id) for user_id, count in self.counts.items() if count > 0)
+
+    def increment(self, user_id, amount=1):
+        count = self.counts.get(user_id, 0)
+        if count > 0:
+            position = bisect.bisect_left(self._order, (-count, user_id))
+            del self._order[position]
+        self.counts[user_id] = count + amount
+        bisect.insort(self._order, (-(count + amount), user_id))
+
+    def __len__(self):
+        return len(self._order)
+
+    def top(self, limit):
+        """Returns the first limit (user_id, count), highest count first."""
+        return [(user_id, -negative_count) for negative_count, user_id in self._order[:limit]]
+
+    def rank(self, user_id):
+        """Returns the user's 1-based rank, or None if they never attended."""
+        count = self.counts.get(user_id, 0)
+        if count <= 0:
+            return None
+        return bisect.bisect_left(self._order, (-count,)) + 1
+
+if hasattr(int, "bit_count"):
+    count_bits = int.bit_count
+else:  # Python < 3.10
+    def count_bits(bits):
+        return bin(bits).count("1")
+
+def longest_run(bits):
+    """Returns the length of the longest run of set bits, in O(log length) big-integer operations."""
+    if not bits:
+        return 0
+    # levels[k] has bit i set where bits i .. i + 2**k - 1 are all set
+    levels = [bits]
+    while True:
+        doubled = levels[-1] & (levels[-1] >> (1 << (len(levels) - 1)))
+        if not doubled:
+            break
+        levels.append(doubled)
+    # Extend the longest power-of-two run by ever smaller powers of two
+    runs, length = levels[-1], 1 << (len(levels) - 1)
+    for k in range(len(levels) - 2, -1, -1):
+        extended = runs & (levels[k] >> length)
+        if extended:
+            runs, length = extended, length + (1 << k)
+    return length
+
+class AttendanceDays:
+    """Every user's attended days as one integer bitmap, bit i standing for BITMAP_EPOCH + i days.
+
+    A user costs one bit per day since the epoch, and the analytics work on whole bitmaps with
+    shifts and masks instead of looping over days.
+    """
+
+    def __init__(self, bitmaps=None):
+        self.bitmaps = bitmaps or {}  # user_id -> bitmap
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({int(user_id_str): int(bits, 16) for user_id_str, bits in data.items()})
+
+    def to_json(self):
+        return {str(user_id): format(bits, "x") for user_id, bits in self.bitmaps.items()}
+
+    @staticmethod
+    def day_index(date):
+        return (date - BITMAP_EPOCH).days
+
+    def snapshot(self, user_ids=None):
+        """Returns a copy that later attendance leaves unchanged, of every user or only the given ones."""
+        if user_ids is None:
+            return AttendanceDays(dict(self.bitmaps))
+        return AttendanceDays({user_id: self.bitmaps[user_id] for user_id in user_ids if user_id in self.bitmaps})
+
+    def add(self, user_id, date):
+        index = self.day_index(date)
+        if index >= 0:
+            self.bitmaps[user_id] = self.bitmaps.get(user_id, 0) | (1 << index)
+
+    def _window(self, bits, start, end):
+        """Returns the bits of the days from start to end inclusive, shifted down to bit 0."""
+        first, last = max(self.day_index(start), 0), self.day_index(end)
+        if last < first:
+            return 0
+        return (bits >> first) & ((1 << (last - first + 1)) - 1)
+
+    def attended(self, user_id, date):
+        index = self.day_index(date)
+        return index >= 0 and bool((self.bitmaps.get(user_id, 0) >> index) & 1)
+
+    def week_masks(self, week_start):
+        """Returns the days each user attended in the week as a bitmask, bit 0 being Monday."""
+        masks = {}
+        for user_id, bits in self.bitmaps.items():
+            mask = self._window(bits, week_start, week_start + datetime.timedelta(days=6))
+            if mask:
+                masks[user_id] = mask
+        return masks
+
+    def attended_days(self, user_id, start, end):
+        """Returns how many days from start to end inclusive the user attended."""
+        return count_bits(self._window(self.bitmaps.get(user_id, 0), start, end))
+
+    def current_streak(self, user_id, today):
+        """Returns the run of attended days ending today, or yesterday if today is not attended yet."""
+        bits = self.bitmaps.get(user_id, 0)
+        end = self.day_index(today)
+        if not (bits >> end) & 1:
+            end -= 1
+        if end < 0:
+            return 0
+        # The highest set bit of the missed days marks where the streak starts
+        missed = ~bits & ((1 << (end + 1)) - 1)
+        return end + 1 - missed.bit_length()
+
+    def longest_streak(self, user_id):
+        return longest_run(self.bitmaps.get(user_id, 0))
+
+    def weekday_totals(self, start, end):
+        """Returns the attendances of all users from start to end inclusive, per weekday (Monday first)."""
+        first, last = max(self.day_index(start), 0), self.day_index(end)
+        if last < first:
+            return [0] * 7
+        days = last - first + 1
+        window = (1 << days) - 1
+        every_seventh = ((1 << (7 * (days // 7 + 1))) - 1) // 127 & window  # Bits 0, 7, 14, ...
+        masks = [every_seventh << ((weekday - first) % 7) & window for weekday in range(7)]
+        totals = [0] * 7
+        for bits in self.bitmaps.values():
+            bits = (bits >> first) & window
+            if bits:
+                for weekday, mask in enumerate(masks):
+                    totals[weekday] += count_bits(bits & mask)
+        return totals
+
+def append_journal(path, events):
+    """Appends attendance events to a journal, one JSON record per line."""
+    with metrics.timer("toha_disk_seconds", operation="append", file=os.path.basename(path)):
+        encoded = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        with open(path, "ab") as f:
+            f.write(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+    metrics.count("toha_disk_write_bytes_total", len(encoded), file=os.path.basename(path))
+
+class GuildAttendance:
+    """Keeps one guild's attendance state in memory and journals changes to disk off the event loop.
+
+    Every change is an event with an increasing sequence number. Each batch of events is appended
+    to the journal as it is recorded. The background flusher compacts the full state into the
+    snapshot together with the sequence number it covers, so replaying the journal on startup
+    never applies an event twice.
+    """
+
+    def __init__(self, snapshot_file, journal_file):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.attendance = empty_attendance()
+        self.week = None  # Monday of the week self.attendance is for; unknown in older files
+        self.cumulative = {}
+        self.ranking = None  # AttendanceRanking of the cumulative counts, built once loaded
+        self.days = AttendanceDays()
+        self.loaded = False
+        self.seq = 0  # Sequence number of the latest event
+        self.journal_size = 0  # Number of events in the journal since the last compaction
+        self.compact_on_start = False  # Whether the flusher compacts first, for state not yet in the snapshot
+        self._pending = []  # Events not yet appended to the journal
+        # Serializes writes to this guild's snapshot and journal; other guilds never wait for it
+        self._lock = TimedLock("attendance journal")
+        self._flush_task = None
+
+    def read(self, seed=None):
+        """Reads the snapshot and replays the journal on top of it, without writing anything.
+
+        Without a snapshot, the state starts from seed() if given, otherwise empty.
+        """
+        snapshot = read_json_file(self.snapshot_file, None)
+        if snapshot is not None:
+            self._adopt(snapshot["attendance"], snapshot["cumulative"])
+            self.days = AttendanceDays.from_json(snapshot.get("days", {}))  # Older snapshots have no day history
+            self.week = datetime.date.fromisoformat(snapshot["week"]) if snapshot.get("week") else None
+            self.seq = snapshot["seq"]
+        elif seed is not None:
+            self._adopt(*seed())
+        self._replay_journal()
+
+    def _adopt(self, attendance, cumulative):
+        """Takes over state read from disk, where older files store user IDs as strings."""
+        self.attendance = {day: {int(user_id) for user_id in attendance.get(day, ())} for day in weekdays_emojis}
+        self.cumulative = {int(user_id): count for user_id, count in cumulative.items()}
+
+    def load(self, seed=None):
+        """Reads the state from disk. Disk is only read the first time.
+
+        Nothing is written here, as this runs on the event loop. A replayed journal, or state
+        seeded from legacy files, is compacted by the background flusher when it starts.
+        """
+        if self.loaded:
+            return
+        seeded = seed is not None and not os.path.exists(self.snapshot_file)
+        self.read(seed)
+        self.ranking = AttendanceRanking(self.cumulative)
+        self.loaded = True
+        self.compact_on_start = seeded or self.journal_size > 0
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_file):
+            return
+        metrics.count("toha_disk_read_bytes_total", os.path.getsize(self.journal_file), file=os.path.basename(self.journal_file))
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn record left by a crash in the middle of an append
+                self.journal_size += 1
+                if event["seq"] <= self.seq:
+                    continue  # Already included in the snapshot
+                self._apply(event)
+                self.seq = event["seq"]
+
+    def _apply(self, event):
+        if event["op"] == "attend":
+            user_id = int(event["user"])  # Older journals store the ID as a string
+            day_name = event.get("day")  # Only set for dates in the current week
+            if day_name is not None:
+                if user_id in self.attendance[day_name]:
+                    return
+                self.attendance[day_name].add(user_id)
+            self.cumulative[user_id] = self.cumulative.get(user_id, 0) + 1
+            if self.ranking is not None:
+                self.ranking.increment(user_id)
+            if "date" in event:  # Journaled before day history was kept otherwise
+                date = datetime.date.fromisoformat(event["date"])
+                self.days.add(user_id, date)
+                if day_name is not None and self.week is None:
+                    self.week = week_start_of(date)
+        elif event["op"] == "reset":
+            self.attendance = empty_attendance()
+            self.week = datetime.date.fromisoformat(event["week"]) if event.get("week") else None
+            if self.week is not None:
+                # Attendance recorded early, before the rollover, already belongs to the new week
+                for user_id, mask in self.days.week_masks(self.week).items():
+                    for weekday, users in enumerate(self.attendance.values()):
+                        if mask >> weekday & 1:
+                            users.add(user_id)
+
+    def _log(self, event):
+        """Applies an event in memory and queues it for the journal."""
+        self.seq += 1
+        event["seq"] = self.seq
+        self._apply(event)
+        self._pending.append(event)
+
+    def record(self, user_id, date):
+        """Records attendance for the user on the given date. Returns False if it was already recorded.
+
+        Only dates in the current week count toward the weekly attendance. A date in a week that
+        was already reset still counts toward the cumulative attendance and day history, and one in
+        a week not started yet moves into the weekly attendance when that week's reset comes.
+        """
+        if self.days.attended(user_id, date):
+            return False
+        event = {"op": "attend", "user": user_id, "date": date.isoformat()}
+        if self.week is None or week_start_of(date) == self.week:
+            day_name = list(weekdays_emojis.keys())[date.weekday()]
+            if user_id in self.attendance[day_name]:
+                return False  # Recorded before day history was kept
+            event["day"] = day_name
+        self._log(event)
+        return True
+
+    async def reset_week(self, week_start):
+        """Starts the weekly attendance of the week beginning on week_start and snapshots the rollover right away."""
+        self._log({"op": "reset", "week": week_start.isoformat()})
+        await self.compact()
+
+    def day_count(self, date):
+        """Returns the number of users who attended on the given date of the current week."""
+        return len(self.attendance[list(weekdays_emojis.keys())[date.weekday()]])
+
+    def weekly_counts(self, week_start):
+        """Returns the number of days each user attended in the given week, keyed by user ID."""
+        return {user_id: count_bits(mask) for user_id, mask in self.week_masks(week_start).items()}
+
+    def week_masks(self, week_start):
+        """Returns the days each user attended in the given week as a bitmask, bit 0 being Monday.
+
+        A week other than the current one, e.g. one a retried rollover already reset, is read from
+        the day history.
+        """
+        if self.week is not None and week_start != self.week:
+            return self.days.week_masks(week_start)
+        masks = {}
+        for weekday, users in enumerate(self.attendance.values()):
+            for user_id in users:
+                masks[user_id] = masks.get(user_id, 0) | (1 << weekday)
+        return masks
+
+    def days_attended(self, user_id):
+        """Returns the number of days the user attended in the current week."""
+        return sum(user_id in users for users in self.attendance.values())
+
+    def _snapshot(self):
+        """Copies the current state so it can be written while handlers keep mutating it.
+
+        The bitmaps are only copied here; encoding them is left to _write_snapshot, off the event loop.
+        """
+        return {
+            "seq": self.seq,
+            "attendance": {day: sorted(users) for day, users in self.attendance.items()},
+            "week": self.week.isoformat() if self.week else None,
+            "cumulative": dict(self.cumulative),
+            "days": self.days.snapshot(),
+        }
+
+    def _write_snapshot(self, snapshot):
+        write_json_file(self.snapshot_file, {**snapshot, "days": snapshot["days"].to_json()})
+        # The snapshot covers every journaled event, so the journal can start over
+        open(self.journal_file, "w", encoding="utf-8").close()
+
+    async def flush(self):
+        """Appends pending events to the journal off the event loop, with one fsync for all of them."""
+        async with self._lock:
+            if not self._pending:
+                return
+            events, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(append_journal, self.journal_file, events)
+            except OSError as e:
+                self._pending = events + self._pending  # Keep the events so the next flush retries them
+                print(f"Failed to append to attendance journal {self.journal_file}: {e}")
+                return
+            self.journal_size += len(events)
+
+    async def compact(self):
+        """Writes a new snapshot off the event loop and truncates the journal."""
+        async with self._lock:
+            await self._compact()
+
+    async def _compact(self):
+        snapshot = self._snapshot()
+        events, self._pending = self._pending, []  # Covered by the snapshot
+        try:
+            await asyncio.to_thread(self._write_snapshot, snapshot)
+        except OSError as e:
+            self._pending = events + self._pending
+            print(f"Failed to write attendance snapshot {self.snapshot_file}: {e}")
+            return
+        self.journal_size = 0
+        self.compact_on_start = False
+
+    def flush_now(self):
+        """Compacts synchronously. Used on shutdown once the event loop has stopped."""
+        if self.loaded:
+            self._write_snapshot(self._snapshot())
+            self._pending = []
+            self.journal_size = 0
+            self.compact_on_start = False
+
+    def start(self):
+        """Starts the background flusher if it is not already running."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run_flusher())
+
+    async def _run_flusher(self):
+        if self.compact_on_start:
+            await self.compact()  # Start from a fresh snapshot and an empty journal
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            await self.flush()  # Retries events whose append failed
+            if self.journal_size >= COMPACT_THRESHOLD:
+                await self.compact()
+
+def read_legacy_attendance():
+    """Reads the single-guild attendance data kept before guilds were partitioned.
+
+    Returns (attendance, cumulative) from the top-level snapshot and journal, or from the
+    original attendance.json / cumulative_attendance.json files if there is no snapshot.
+    """
+    legacy = GuildAttendance(SNAPSHOT_FILE, JOURNAL_FILE)
+    legacy.read(seed=lambda: (
+        read_json_file(ATTENDANCE_FILE, empty_attendance()),
+        read_json_file(CUMULATIVE_ATTENDANCE_FILE, {})
+    ))
+    return legacy.attendance, legacy.cumulative
+
+class AttendanceStore:
+    """JSON attendance storage partitioned per guild.
+
+    Each guild has its own directory under GUILD_DATA_DIR with its own snapshot, journal,
+    lock and flusher, so guilds never contend on each other's files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.partitions = {}  # guild_id -> GuildAttendance
+        self.legacy_guild_id = None
+        self.loaded = False
+        self._started = False
+
+    def load(self, legacy_guild_id=None):
+        """Loads every guild that has data on disk. Legacy single-guild data is migrated into legacy_guild_id."""
+        if self.loaded:
+            return
+        self.legacy_guild_id = legacy_guild_id
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.isdigit():
+                self.partition(int(name))
+        if legacy_guild_id is not None:
+            self.partition(legacy_guild_id)
+        self.loaded = True
+
+    def partition(self, guild_id):
+        """Returns the guild's partition, loading or creating it on first use."""
+        partition = self.partitions.get(guild_id)
+        if partition is None:
+            guild_dir = os.path.join(self.directory, str(guild_id))
+            os.makedirs(guild_dir, exist_ok=True)
+            partition = GuildAttendance(os.path.join(guild_dir, SNAPSHOT_FILE), os.path.join(guild_dir, JOURNAL_FILE))
+            partition.load(seed=read_legacy_attendance if guild_id == self.legacy_guild_id else None)
+            self.partitions[guild_id] = partition
+            if self._started:
+                partition.start()
+        return partition
+
+    def version(self, guild_id):
+        """Returns a number that changes whenever the guild's attendance changes."""
+        return self.partition(guild_id).seq  # Every change is an event with a new sequence number
+
+    async def record(self, guild_id, user_id, date):
+        """Records attendance for the user on the given date. Returns False if it was already recorded."""
+        return await self.record_many(guild_id, [(user_id, date)]) == 1
+
+    async def record_many(self, guild_id, entries):
+        """Records a batch of (user_id, date) attendances and journals them before returning.
+
+        Returns the number of new records.
+        """
+        partition = self.partition(guild_id)
+        recorded = sum(partition.record(user_id, date) for user_id, date in entries)
+        await partition.flush()
+        return recorded
+
+    async def reset_week(self, guild_id, week_start):
+        """Starts the guild's weekly attendance of a new week and snapshots the rollover right away."""
+        await self.partition(guild_id).reset_week(week_start)
+
+    async def weekly_counts(self, guild_id, week_start):
+        """Returns the number of days each user attended in the given week, keyed by user ID."""
+        return self.partition(guild_id).weekly_counts(week_start)
+
+    async def day_count(self, guild_id, date):
+        """Returns the number of users who attended on the given date."""
+        return self.partition(guild_id).day_count(date)
+
+    async def week_masks(self, guild_id, week_start):
+        """Returns the days each user attended in the given week as a bitmask, bit 0 being Monday."""
+        return self.partition(guild_id).week_masks(week_start)
+
+    async def cumulative_counts(self, guild_id):
+        """Returns the cumulative attendance count of every user, keyed by user ID."""
+        return dict(self.partition(guild_id).cumulative)
+
+    async def cumulative_count(self, guild_id, user_id):
+        """Returns the cumulative attendance count of a single user."""
+        return self.partition(guild_id).cumulative.get(user_id, 0)
+
+    async def top_ranked(self, guild_id, limit):
+        """Returns the limit users with the most attendance as (user_id, count), highest first."""
+        return self.partition(guild_id).ranking.top(limit)
+
+    async def rank_of(self, guild_id, user_id):
+        """Returns (rank, cumulative count, number of ranked users); rank is None if they never attended."""
+        ranking = self.partition(guild_id).ranking
+        return ranking.rank(user_id), ranking.counts.get(user_id, 0), len(ranking)
+
+    async def attendance_days(self, guild_id):
+        """Returns the guild's AttendanceDays. Only days recorded since it was introduced are known."""
+        return self.partition(guild_id).days
+
+    async def member_history(self, guild_id, user_ids, week_start):
+        """Returns {user_id: (cumulative count, {week: days attended})} for a page of users.
+
+        Only the current week is kept in this layout, so it is reported as week_start.
+        """
+        partition = self.partition(guild_id)
+        history = {}
+        for user_id in user_ids:
+            days = partition.days_attended(user_id)
+            history[user_id] = (partition.cumulative.get(user_id, 0), {week_start.isoformat(): days} if days else {})
+        return history
+
+    def close(self):
+        """Persists everything still pending. Called on shutdown once the event loop has stopped."""
+        for partition in self.partitions.values():
+            partition.flush_now()
+
+    def start(self):
+        """Starts the background flushers of all guilds, and of guilds added later."""
+        self._started = True
+        for partition in self.partitions.values():
+            partition.start()
+
+class SqliteAttendanceStore:
+    """Stores attendance history in SQLite with one row per (guild, user, date).
+
+    Rows are never deleted on rollover, so the full history stays queryable. Database access
+    runs off the event loop: writes on a single writer thread, and queries on a pool of
+    read-only connections which, in WAL mode, neither block each other nor wait for writes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS attendance (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,  -- ISO date of the attended day
+            week TEXT NOT NULL,  -- ISO date of that week's Monday
+            PRIMARY KEY (guild_id, user_id, date)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS attendance_by_week ON attendance (guild_id, week, user_id);
+        CREATE TABLE IF NOT EXISTS cumulative (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS attendance_days (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            bits BLOB NOT NULL,  -- AttendanceDays bitmap, little-endian
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.loaded = False
+        self._db = None  # Writer connection, only used on the writer thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="attendance-db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=SQLITE_READERS, thread_name_prefix="attendance-db-reader")
+        self._reader_local = threading.local()
+        self._reader_dbs = []
+        self.rankings = {}  # guild_id -> AttendanceRanking, updated as each write commits
+        self.days = {}  # guild_id -> AttendanceDays, likewise
+        self.versions = {}  # guild_id -> number of committed writes that changed something
+        self._write_waits = wait_stats("database writer")
+        self._read_waits = wait_stats("database reader")
+
+    def load(self, legacy_guild_id=None):
+        """Opens the database and creates the schema. Migrates the JSON data into an empty database."""
+        if self.loaded:
+            return
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        is_empty = self._db.execute("SELECT 1 FROM cumulative LIMIT 1").fetchone() is None
+        if is_empty and legacy_guild_id is not None:
+            self._migrate_json(legacy_guild_id)
+        # Built before any write is accepted, so every later increment applies on top of it
+        for guild_id, user_id, count in self._db.execute("SELECT guild_id, user_id, count FROM cumulative"):
+            self.ranking(guild_id).increment(user_id, count)
+        if self._db.execute("SELECT 1 FROM attendance_days LIMIT 1").fetchone() is None:
+            self._backfill_days()
+        for guild_id, user_id, bits in self._db.execute("SELECT guild_id, user_id, bits FROM attendance_days"):
+            self.guild_days(guild_id).bitmaps[user_id] = int.from_bytes(bits, "little")
+        self.loaded = True
+
+    def _migrate_json(self, guild_id):
+        attendance, cumulative = read_legacy_attendance()
+        week_start = week_start_of(get_current_time().date())
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO cumulative (guild_id, user_id, count) VALUES (?, ?, ?)",
+                [(guild_id, user_id, count) for user_id, count in cumulative.items()]
+            )
+            # The JSON layout only knows weekdays, so place them in the current week
+            for index, users in enumerate(attendance.values()):
+                date = week_start + datetime.timedelta(days=index)
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO attendance (guild_id, user_id, date, week) VALUES (?, ?, ?, ?)",
+                    [(guild_id, user_id, date.isoformat(), week_start.isoformat()) for user_id in users]
+                )
+
+    def _backfill_days(self):
+        """Builds the day bitmaps of a database created before they were kept."""
+        rows = self._db.execute(
+            "SELECT guild_id, user_id, CAST(julianday(date) - julianday(?) AS INTEGER) FROM attendance "
+            "ORDER BY guild_id, user_id", (BITMAP_EPOCH.isoformat(),)
+        )
+        bitmaps = []
+        for (guild_id, user_id), days in itertools.groupby(rows, key=lambda row: row[:2]):
+            bits = bytearray()
+            for _, _, index in days:
+                if index < 0:
+                    continue
+                if index // 8 >= len(bits):
+                    bits.extend(bytes(index // 8 + 1 - len(bits)))
+                bits[index // 8] |= 1 << (index % 8)
+            bitmaps.append((guild_id, user_id, bytes(bits)))
+        with self._db:
+            self._db.executemany("INSERT INTO attendance_days (guild_id, user_id, bits) VALUES (?, ?, ?)", bitmaps)
+
+    def _reader_db(self):
+        """Returns the calling reader thread's own read-only connection."""
+        db = getattr(self._reader_local, "db", None)
+        if db is None:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._reader_local.db = db
+            self._reader_dbs.append(db)
+        return db
+
+    @staticmethod
+    async def _submit(executor, stats, func, *args):
+        """Runs func on the executor, recording how long it queued for a thread."""
+        queued = time.perf_counter()
+
+        def timed():
+            stats.add(time.perf_counter() - queued)
+            return func(*args)
+
+        return await asyncio.get_running_loop().run_in_executor(executor, timed)
+
+    async def _write(self, func, *args):
+        return await self._submit(self._writer, self._write_waits, func, *args)
+
+    async def _read(self, func, *args):
+        return await self._submit(self._readers, self._read_waits, lambda: func(self._reader_db(), *args))
+
+    def ranking(self, guild_id):
+        """Returns the guild's ranking, creating an empty one for a new guild."""
+        ranking = self.rankings.get(guild_id)
+        if ranking is None:
+            ranking = self.rankings[guild_id] = AttendanceRanking()
+        return ranking
+
+    def guild_days(self, guild_id):
+        """Returns the guild's day bitmaps, creating empty ones for a new guild."""
+        days = self.days.get(guild_id)
+        if days is None:
+            days = self.days[guild_id] = AttendanceDays()
+        return days
+
+    def _record_many(self, guild_id, entries):
+        # The weekly rows and the cumulative counts of a batch are updated in one transaction.
+        # Returns the (user_id, date) of the new records.
+        recorded = []
+        with self._db:
+            for user_id, date in entries:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO attendance (guild_id, user_id, date, week) VALUES (?, ?, ?, ?)",
+                    (guild_id, user_id, date.isoformat(), week_start_of(date).isoformat())
+                )
+                if cursor.rowcount == 0:
+                    continue  # Already recorded
+                self._db.execute(
+                    "INSERT INTO cumulative (guild_id, user_id, count) VALUES (?, ?, 1) "
+                    "ON CONFLICT (guild_id, user_id) DO UPDATE SET count = count + 1",
+                    (guild_id, user_id)
+                )
+                self._add_day(guild_id, user_id, date)
+                recorded.append((user_id, date))
+        return recorded
+
+    def _add_day(self, guild_id, user_id, date):
+        index = AttendanceDays.day_index(date)
+        if index < 0:
+            return
+        row = self._db.execute(
+            "SELECT bits FROM attendance_days WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ).fetchone()
+        bits = (int.from_bytes(row[0], "little") if row else 0) | (1 << index)
+        self._db.execute(
+            "INSERT INTO attendance_days (guild_id, user_id, bits) VALUES (?, ?, ?) "
+            "ON CONFLICT (guild_id, user_id) DO UPDATE SET bits = excluded.bits",
+            (guild_id, user_id, bits.to_bytes((bits.bit_length() + 7) // 8, "little"))
+        )
+
+    def version(self, guild_id):
+        """Returns a number that changes whenever the guild's attendance changes."""
+        return self.versions.get(guild_id, 0)
+
+    async def record(self, guild_id, user_id, date):
+        """Records attendance for the user on the given date. Returns False if it was already recorded."""
+        return await self.record_many(guild_id, [(user_id, date)]) == 1
+
+    async def record_many(self, guild_id, entries):
+        """Records a batch of (user_id, date) attendances. Returns the number of new records."""
+        recorded = await self._write(self._record_many, guild_id, list(entries))
+        # Writes complete on the event loop in commit order, so the ranking follows the database
+        ranking, days = self.ranking(guild_id), self.guild_days(guild_id)
+        for user_id, date in recorded:
+            ranking.increment(user_id)
+            days.add(user_id, date)
+        if recorded:
+            self.versions[guild_id] = self.version(guild_id) + 1
+        return len(recorded)
+
+    async def reset_week(self, guild_id, week_start):
+        """Nothing to clear: weeks are told apart by date, so history is kept."""
+
+    @staticmethod
+    def _weekly_counts(db, guild_id, week_start):
+        rows = db.execute(
+            "SELECT user_id, COUNT(*) FROM attendance WHERE guild_id = ? AND week = ? GROUP BY user_id",
+            (guild_id, week_start.isoformat())
+        )
+        return dict(rows.fetchall())
+
+    async def weekly_counts(self, guild_id, week_start):
+        """Returns the number of days each user attended in the given week, keyed by user ID."""
+        return await self._read(self._weekly_counts, guild_id, week_start)
+
+    @staticmethod
+    def _week_masks(db, guild_id, week_start):
+        rows = db.execute(
+            "SELECT user_id, date FROM attendance WHERE guild_id = ? AND week = ?", (guild_id, week_start.isoformat())
+        )
+        masks = {}
+        for user_id, date in rows:
+            masks[user_id] = masks.get(user_id, 0) | (1 << datetime.date.fromisoformat(date).weekday())
+        return masks
+
+    async def week_masks(self, guild_id, week_start):
+        """Returns the days each user attended in the given week as a bitmask, bit 0 being Monday."""
+        return await self._read(self._week_masks, guild_id, week_start)
+
+    @staticmethod
+    def _day_count(db, guild_id, date):
+        row = db.execute(
+            "SELECT COUNT(*) FROM attendance WHERE guild_id = ? AND week = ? AND date = ?",
+            (guild_id, week_start_of(date).isoformat(), date.isoformat())
+        ).fetchone()
+        return row[0]
+
+    async def day_count(self, guild_id, date):
+        """Returns the number of users who attended on the given date."""
+        return await self._read(self._day_count, guild_id, date)
+
+    @staticmethod
+    def _cumulative_counts(db, guild_id):
+        rows = db.execute("SELECT user_id, count FROM cumulative WHERE guild_id = ?", (guild_id,))
+        return dict(rows.fetchall())
+
+    async def cumulative_counts(self, guild_id):
+        """Returns the cumulative attendance count of every user, keyed by user ID."""
+        return await self._read(self._cumulative_counts, guild_id)
+
+    @staticmethod
+    def _cumulative_count(db, guild_id, user_id):
+        row = db.execute(
+            "SELECT count FROM cumulative WHERE guild_id = ? AND user_id = ?", (guild_id, user_id)
+        ).fetchone()
+        return row[0] if row else 0
+
+    async def cumulative_count(self, guild_id, user_id):
+        """Returns the cumulative attendance count of a single user."""
+        return await self._read(self._cumulative_count, guild_id, user_id)
+
+    async def top_ranked(self, guild_id, limit):
+        """Returns the limit users with the most attendance as (user_id, count), highest first."""
+        return self.ranking(guild_id).top(limit)
+
+    async def rank_of(self, guild_id, user_id):
+        """Returns (rank, cumulative count, number of ranked users); rank is None if they never attended."""
+        ranking = self.ranking(guild_id)
+        return ranking.rank(user_id), ranking.counts.get(user_id, 0), len(ranking)
+
+    async def attendance_days(self, guild_id):
+        """Returns the guild's AttendanceDays over its whole history."""
+        return self.guild_days(guild_id)
+
+    @staticmethod
+    def _member_history(db, guild_id, user_ids):
+        history = {user_id: (0, {}) for user_id in user_ids}
+        placeholders = ", ".join("?" * len(user_ids))
+        rows = db.execute(
+            f"SELECT user_id, count FROM cumulative WHERE guild_id = ? AND user_id IN ({placeholders})",
+            (guild_id, *user_ids)
+        )
+        for user_id, count in rows:
+            history[user_id] = (count, history[user_id][1])
+        # Served by the primary key, so only the page's own rows are read
+        rows = db.execute(
+            f"SELECT user_id, week, COUNT(*) FROM attendance WHERE guild_id = ? AND user_id IN ({placeholders}) "
+            "GROUP BY user_id, week ORDER BY user_id, week",
+            (guild_id, *user_ids)
+        )
+        for user_id, week, days in rows:
+            history[user_id][1][week] = days
+        return history
+
+    async def member_history(self, guild_id, user_ids, week_start):
+        """Returns {user_id: (cumulative count, {week: days attended})} for a page of users, over all weeks."""
+        if not user_ids:
+            return {}
+        return await self._read(self._member_history, guild_id, list(user_ids))
+
+    def start(self):
+        """Every change is committed as it happens, so there is no background flusher."""
+
+    def close(self):
+        """Closes the database. Called on shutdown once the event loop has stopped."""
+        if self._db is not None:
+            self._writer.shutdown(wait=True)
+            self._readers.shutdown(wait=True)
+            for db in self._reader_dbs:
+                db.close()
+            self._db.close()
+            self._db = None
+
+class PriorityGate:
+    """Limits concurrent calls, letting the highest-priority waiter in first when a slot frees up."""
+
+    def __init__(self, slots):
+        self._slots = slots
+        self._waiters = []  # Heap of (priority, order, future)
+        self._order = itertools.count()
+
+    async def acquire(self, priority):
+        if self._slots > 0 and not self._waiters:
+            self._slots -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        await future  # The slot is handed over directly by release()
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._slots += 1
+
+class RestScheduler:
+    """Queues outbound REST calls per route bucket and runs them in priority order.
+
+    Each bucket is drained by its own worker, one call at a time, so calls that share a
+    Discord rate limit never race each other. Calls that hit a 429 or a server error are
+    retried with the delay from the rate-limit headers, falling back to exponential backoff.
+    """
+
+    def __init__(self, concurrency):
+        self._gate = PriorityGate(concurrency)
+        self._queues = {}  # bucket -> asyncio.PriorityQueue
+        self._workers = {}  # bucket -> worker task
+        self._order = itertools.count()  # Keeps calls of the same priority in FIFO order
+
+    def submit(self, bucket, priority, func, *args, **kwargs):
+        """Queues func(*args, **kwargs) on the bucket and returns a future for its result."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(bucket)
+        if queue is None:
+            queue = self._queues[bucket] = asyncio.PriorityQueue()
+            self._workers[bucket] = asyncio.create_task(self._run_bucket(bucket, queue))
+        queue.put_nowait((priority, next(self._order), time.monotonic(), future, func, args, kwargs))
+        return future
+
+    async def call(self, bucket, priority, func, *args, **kwargs):
+        """Queues a call and waits for its result."""
+        return await self.submit(bucket, priority, func, *args, **kwargs)
+
+    def depth(self):
+        """Returns the number of calls waiting across all buckets."""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def _run_bucket(self, bucket, queue):
+        while not queue.empty():
+            priority, _, queued_at, future, func, args, kwargs = queue.get_nowait()
+            if future.cancelled():
+                continue
+            wait = time.monotonic() - queued_at
+            metrics.observe("toha_rest_wait_seconds", wait)
+            if wait > REST_WAIT_WARNING:
+                print(f"REST bucket {bucket} is throttled: waited {wait:.1f}s, {self.depth()} calls queued")
+            try:
+                result = await self._execute(priority, func, args, kwargs)
+            except Exception as e:
+                metrics.count("toha_rest_failed_total")
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                metrics.count("toha_rest_completed_total")
+                if not future.cancelled():
+                    future.set_result(result)
+        # No await since the last empty() check, so nothing can have been queued in between
+        del self._queues[bucket]
+        del self._workers[bucket]
+
+    async def _execute(self, priority, func, args, kwargs):
+        attempt = 0
+        while True:
+            await self._gate.acquire(priority)
+            try:
+                return await func(*args, **kwargs)
+            except discord.RateLimited as e:
+                delay = e.retry_after  # Already counted by RateLimitCounter
+                if attempt >= REST_MAX_RETRIES:
+                    raise
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    raise
+                if e.status == 429:
+                    metrics.count("toha_rest_rate_limited_total")  # Raised without being logged, e.g. by Cloudflare
+                if attempt >= REST_MAX_RETRIES:
+                    raise
+                delay = self._retry_delay(e, attempt)
+            finally:
+                self._gate.release()
+            attempt += 1
+            metrics.count("toha_rest_retries_total")
+            print(f"Retrying REST call in {delay:.1f}s (attempt {attempt}/{REST_MAX_RETRIES})")
+            await asyncio.sleep(delay)  # The bucket stays blocked while it is rate limited
+
+    @staticmethod
+    def _retry_delay(error, attempt):
+        headers = getattr(error.response, "headers", None) or {}
+        for header in ("Retry-After", "X-RateLimit-Reset-After"):
+            try:
+                return float(headers[header])
+            except (KeyError, ValueError):
+                continue
+        return REST_BACKOFF_BASE * 2 ** attempt
+
+rest_scheduler = RestScheduler(REST_CONCURRENCY)
+
+async def send_followup(interaction, *args, **kwargs):
+    """Sends a follow-up to a slash command through the REST scheduler, ahead of board and cleanup calls."""
+    return await rest_scheduler.call(
+        f"followup:{interaction.id}", PRIORITY_INTERACTIVE, interaction.followup.send, *args, **kwargs
+    )
+
+async def send_pages(bucket, priority, send, pages, what):
+    """Queues every page of embeds on the bucket at once, so they are sent in order, and logs the ones that fail."""
+    results = await asyncio.gather(
+        *(rest_scheduler.submit(bucket, priority, send, embeds=embeds) for embeds in pages),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Failed to send {what}: {result}")
+
+def add_board_reactions(message, emojis):
+    """Queues the weekday emoji reactions on a board message and returns their futures, in weekday order."""
+    bucket = f"reactions:{message.channel.id}"
+    return [
+        rest_scheduler.submit(bucket, PRIORITY_BOARD, message.add_reaction, emoji)
+        for emoji in emojis
+    ]
+
+if STORAGE_BACKEND == "sqlite":
+    attendance_store = SqliteAttendanceStore(SQLITE_FILE)
+else:
+    attendance_store = AttendanceStore(GUILD_DATA_DIR)
+
+class WeekArchive:
+    """Append-only binary archive of one guild's finished weeks, indexed by ISO week.
+
+    Each week is one record: a header (ISO year, ISO week, user count), the sorted user IDs as
+    little-endian uint64, and one byte per user with the attended weekdays as bits (bit 0 is
+    Monday). The index file holds a fixed-size (year, week, offset, length) entry per record;
+    a week archived again, e.g. by a retried rollover, is superseded by its later entry, unless
+    the later one is empty.
+    Queries map the archive into memory and only touch the records of the weeks they ask for.
+    """
+
+    HEADER = struct.Struct("<HBxI")
+    INDEX_ENTRY = struct.Struct("<HBxQI")
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, ARCHIVE_FILE)
+        self.index_path = os.path.join(directory, ARCHIVE_INDEX_FILE)
+        self.directory = directory
+        self._index = None  # (iso_year, iso_week) -> (offset, length)
+        self._lock = threading.Lock()  # Appends and queries run on worker threads
+
+    def _load_index(self):
+        if self._index is None:
+            index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "rb") as f:
+                    data = f.read()
+                usable = len(data) - len(data) % self.INDEX_ENTRY.size  # Ignore an entry torn by a crash
+                for year, week, offset, length in self.INDEX_ENTRY.iter_unpack(data[:usable]):
+                    index[(year, week)] = (offset, length)
+            self._index = index
+        return self._index
+
+    def weeks(self):
+        """Returns the archived (iso_year, iso_week) in order."""
+        with self._lock:
+            return sorted(self._load_index())
+
+    def append(self, week_start, masks):
+        """Archives a finished week given {user_id: weekday bitmask}. Blocking; run it off the event loop."""
+        year, week, _ = week_start.isocalendar()
+        user_ids = sorted(user_id for user_id, mask in masks.items() if mask)
+        record = b"".join((
+            self.HEADER.pack(year, week, len(user_ids)),
+            struct.pack(f"<{len(user_ids)}Q", *user_ids),
+            bytes(masks[user_id] for user_id in user_ids),
+        ))
+        with self._lock:
+            index = self._load_index()
+            if not user_ids and (year, week) in index:
+                return  # Never let an empty week replace one already archived
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            # The record is durable before the index points at it
+            with open(self.index_path, "ab") as f:
+                f.write(self.INDEX_ENTRY.pack(year, week, offset, len(record)))
+                f.flush()
+                os.fsync(f.fileno())
+            index[(year, week)] = (offset, len(record))
+        metrics.count("toha_disk_write_bytes_total", len(record) + self.INDEX_ENTRY.size, file=ARCHIVE_FILE)
+
+    def read_weeks(self, weeks):
+        """Returns {(iso_year, iso_week): {user_id: weekday bitmask}} for the requested weeks that are archived."""
+        with self._lock:
+            index = self._load_index()
+            wanted = [(week, index[week]) for week in weeks if week in index]
+            if not wanted:
+                return {}
+            result = {}
+            with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for week, (offset, length) in wanted:
+                    _, _, count = self.HEADER.unpack_from(view, offset)
+                    ids_offset = offset + self.HEADER.size
+                    user_ids = struct.unpack_from(f"<{count}Q", view, ids_offset)
+                    masks = view[ids_offset + 8 * count:ids_offset + 9 * count]
+                    result[week] = dict(zip(user_ids, masks))
+                    metrics.count("toha_disk_read_bytes_total", length, file=ARCHIVE_FILE)
+            return result
+
+def week_archive(guild_id):
+    """Returns the guild's week archive."""
+    archive = week_archives.get(guild_id)
+    if archive is None:
+        archive = week_archives[guild_id] = WeekArchive(os.path.join(GUILD_DATA_DIR, str(guild_id)))
+    return archive
+
+def iso_week_start(iso_year, iso_week):
+    """Returns the Monday of an ISO week."""
+    return datetime.date.fromisocalendar(iso_year, iso_week, 1)
+
+class MemberIndex:
+    """The non-bot members of one guild and their display names, in a stable sorted order.
+
+    Built once from the member cache and then kept up to date by the member events, so reports
+    and listings never scan and filter the whole cache.
+    """
+
+    _versions = itertools.count()  # Shared, so a rebuilt index never reuses an old version
+
+    def __init__(self):
+        self.names = {}  # member_id -> display name
+        self._order = []  # Sorted (sort key, member_id)
+        self.version = next(self._versions)  # Changes whenever a member joins, leaves or is renamed
+        self._snapshot = None  # (version, sorted (member_id, display_name) tuple)
+
+    @classmethod
+    def build(cls, guild):
+        index = cls()
+        for member in guild.members:
+            if not member.bot:
+                index.names[member.id] = member.display_name
+        index._order = sorted((cls._sort_key(name), member_id) for member_id, name in index.names.items())
+        return index
+
+    @staticmethod
+    def _sort_key(name):
+        return name.casefold()
+
+    def add(self, member):
+        """Adds the member, or re-sorts it if its display name changed."""
+        if member.bot:
+            return
+        name = self.names.get(member.id)
+        if name == member.display_name:
+            return
+        if name is not None:
+            self.remove(member.id)
+        self.names[member.id] = member.display_name
+        bisect.insort(self._order, (self._sort_key(member.display_name), member.id))
+        self.version = next(self._versions)
+
+    def remove(self, member_id):
+        name = self.names.pop(member_id, None)
+        if name is None:
+            return
+        entry = (self._sort_key(name), member_id)
+        position = bisect.bisect_left(self._order, entry)
+        if position < len(self._order) and self._order[position] == entry:
+            del self._order[position]
+        self.version = next(self._versions)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """Yields (member_id, display_name) in sorted order."""
+        for _, member_id in self._order:
+            yield member_id, self.names[member_id]
+
+    def snapshot(self):
+        """Returns the sorted (member_id, display_name) pairs as a tuple, reused until the index changes."""
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            self._snapshot = (self.version, tuple(self))
+        return self._snapshot[1]
+
+    def page(self, after=None, limit=EXPORT_PAGE_SIZE):
+        """Returns up to limit (member_id, display_name) following the cursor, and the next cursor.
+
+        The cursor is a position in the sort order rather than an offset, so members joining
+        or leaving between pages never make a page skip or repeat anyone.
+        """
+        start = 0 if after is None else bisect.bisect_right(self._order, after)
+        entries = self._order[start:start + limit]
+        members = [(member_id, self.names[member_id]) for _, member_id in entries]
+        return members, (entries[-1] if entries else after)
+
+def member_index(guild):
+    """Returns the guild's member index, building it from the member cache on first use."""
+    index = member_indexes.get(guild.id)
+    if index is None:
+        index = member_indexes[guild.id] = MemberIndex.build(guild)
+    return index
+
+class NameCache:
+    """Display names fetched from the gateway on demand, in batches, for low-memory mode.
+
+    Entries expire after NAME_CACHE_TTL seconds, and the least recently used are evicted past
+    NAME_CACHE_SIZE. Users who left the guild or are bots are cached as None, so they are not
+    asked for again on every listing.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # (guild_id, user_id) -> (expires, name or None)
+
+    def _put(self, key, name):
+        self._entries[key] = (time.monotonic() + self.ttl, name)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def resolve(self, guild, user_ids):
+        """Returns {user_id: display name} for the given users who are still members of the guild."""
+        now = time.monotonic()
+        names, missing = {}, []
+        for user_id in user_ids:
+            entry = self._entries.get((guild.id, user_id))
+            if entry is None or entry[0] <= now:
+                missing.append(user_id)
+                continue
+            self._entries.move_to_end((guild.id, user_id))
+            if entry[1] is not None:
+                names[user_id] = entry[1]
+        metrics.count("toha_name_cache_total", len(user_ids) - len(missing), result="hit")
+        metrics.count("toha_name_cache_total", len(missing), result="miss")
+
+        for start in range(0, len(missing), NAME_QUERY_BATCH):
+            batch = missing[start:start + NAME_QUERY_BATCH]
+            try:
+                members = await guild.query_members(user_ids=batch, limit=len(batch), cache=False)
+            except asyncio.TimeoutError:
+                print(f"Timed out resolving {len(batch)} member names in guild {guild.id}")
+                continue  # Not cached, so the next listing asks again
+            found = {member.id: member for member in members}
+            for user_id in batch:
+                member = found.get(user_id)
+                name = member.display_name if member is not None and not member.bot else None
+                self._put((guild.id, user_id), name)
+                if name is not None:
+                    names[user_id] = name
+        return names
+
+name_cache = NameCache(NAME_CACHE_SIZE, NAME_CACHE_TTL)
+
+async def display_names(guild, user_ids):
+    """Returns {user_id: display name} for the given users who are non-bot members of the guild."""
+    if LOW_MEMORY_MODE:
+        return await name_cache.resolve(guild, list(user_ids))
+    names = member_index(guild).names
+    return {user_id: names[user_id] for user_id in user_ids if user_id in names}
+
+async def listed_members(guild, user_ids):
+    """Returns the (member_id, display name) a member listing shows, in name order, as a snapshot.
+
+    Normally that is every non-bot member, from the member index. In low-memory mode it is
+    only those of user_ids (the users with attendance) who are still members.
+    """
+    if not LOW_MEMORY_MODE:
+        return member_index(guild).snapshot()
+    names = await display_names(guild, user_ids)
+    return sorted(names.items(), key=lambda item: (MemberIndex._sort_key(item[1]), item[0]))
+
+def members_version(guild):
+    """Returns the version of the guild's member listing, for render cache keys."""
+    # Low-memory listings follow the attendance version, and names refresh as they expire
+    return None if LOW_MEMORY_MODE else member_index(guild).version
+
+class RenderCache:
+    """Rendered command output, one entry per key, stored with the data version it was rendered from.
+
+    An entry whose version no longer matches is replaced rather than kept beside the new one,
+    so a key never holds more than one rendering. Keys are evicted as the least recently used.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self._entries = collections.OrderedDict()  # key -> (version, value)
+        self._pending = {}  # (key, version) -> future of the value being built
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            metrics.count("toha_render_cache_total", cache=self.name, result="miss")
+            return None
+        self._entries.move_to_end(key)
+        metrics.count("toha_render_cache_total", cache=self.name, result="hit")
+        return entry[1]
+
+    def put(self, key, version, value):
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    async def render(self, key, version, build):
+        """Returns the value cached for key at version, or awaits build() for it and caches the result.
+
+        Callers that miss while the same version is being built wait for that build instead of
+        starting their own.
+        """
+        value = self.get(key, version)
+        if value is not None:
+            return value
+        pending = self._pending.get((key, version))
+        if pending is None:
+            pending = self._pending[(key, version)] = asyncio.ensure_future(build())
+            pending.add_done_callback(lambda _: self._pending.pop((key, version), None))
+        value = await asyncio.shield(pending)  # One caller giving up does not cancel it for the rest
+        self.put(key, version, value)
+        return value
+
+listing_cache = RenderCache("listing", RENDER_CACHE_SIZE)  # ("cumulative", guild_id) -> /누적출석 pages
+embed_cache = RenderCache("embed", RENDER_CACHE_SIZE)  # ("mine", guild_id, user_id) -> /내출석 embed
+
+report_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+
+async def render_off_loop(build, *args):
+    """Runs build(*args) on a report worker, so a large report never holds up the event loop.
+
+    The arguments must be snapshots that the event loop no longer changes.
+    """
+    with metrics.timer("toha_render_seconds", what=build.__name__):
+        return await asyncio.get_running_loop().run_in_executor(report_executor, build, *args)
+
+def paginate_embeds(fields, title, description, color, footer):
+    """Packs (name, value) fields into the fewest embeds and messages within Discord's limits.
+
+    Yields one list of embeds per message. The first embed of each message carries the title,
+    description and thumbnail, and the last one the footer. Fields are consumed lazily, so a
+    long member list is never built into embeds all at once.
+    """
+    thumbnail_url = bot.user.avatar.url if bot.user.avatar else None
+    header_chars = len(title) + len(description)
+    budget = MESSAGE_MAX_EMBED_CHARS - len(footer)
+
+    def finish(embeds):
+        embeds[-1].set_footer(text=footer)
+        return embeds
+
+    embeds, chars = [], 0
+    for name, value in fields:
+        name, value = name[:FIELD_NAME_MAX], value[:FIELD_VALUE_MAX]
+        size = len(name) + len(value)
+        if embeds and len(embeds[-1].fields) < EMBED_MAX_FIELDS and chars + size <= budget:
+            embeds[-1].add_field(name=name, value=value, inline=False)
+            chars += size
+            continue
+        if not embeds or len(embeds) >= MESSAGE_MAX_EMBEDS or chars + size > budget:
+            if embeds:
+                yield finish(embeds)
+            # Start a new message whose first embed carries the header
+            embed = discord.Embed(title=title, description=description, color=color)
+            embed.set_thumbnail(url=thumbnail_url)
+            embeds, chars = [embed], header_chars
+        else:
+            # Continue the current message in another embed
+            embeds.append(discord.Embed(color=color))
+        embeds[-1].add_field(name=name, value=value, inline=False)
+        chars += size
+
+    if not embeds:
+        embed = discord.Embed(title=title, description=description, color=color)
+        embed.set_thumbnail(url=thumbnail_url)
+        embeds = [embed]
+    yield finish(embeds)
+
+class ExportStream(io.RawIOBase):
+    """A readable file whose content is generated while it is uploaded, so no temp file is needed.
+
+    make_chunks() returns a generator of bytes. Only the current chunk is held in memory, and
+    seeking back to the start, as a retried upload does, starts a fresh generator.
+    """
+
+    def __init__(self, make_chunks, name):
+        super().__init__()
+        self.name = name
+        self._make_chunks = make_chunks
+        self._chunks = None
+        self._restart()
+
+    def _restart(self):
+        if self._chunks is not None:
+            self._chunks.close()
+        self._chunks = self._make_chunks()
+        self._buffer = b""
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET and offset == self._position:
+            return self._position
+        if whence == io.SEEK_SET and offset == 0:
+            self._restart()
+            return 0
+        raise io.UnsupportedOperation("An export can only be rewound to the start")
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b""
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._position += size
+        return size
+
+    def close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+        super().close()
+
+def export_chunks(guild, file_format, week_start, loop):
+    """Generates a guild's attendance export page by page, as encoded chunks.
+
+    CSV has one row per member and week (members without history get one row with no week);
+    JSON lines have one object per member. Runs on the upload's reader threads, fetching each
+    page of members and their history on the event loop, which owns that state.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("Exports must be read off the event loop")
+
+    user_ids = []  # Low-memory mode pages over the users with attendance, by ID
+
+    async def fetch_page(after):
+        if not LOW_MEMORY_MODE:
+            members, cursor = member_index(guild).page(after)
+        else:
+            if after is None:
+                user_ids[:] = sorted(await attendance_store.cumulative_counts(guild.id))
+            members, cursor = [], after
+            while not members:
+                start = 0 if cursor is None else bisect.bisect_right(user_ids, cursor)
+                page = user_ids[start:start + EXPORT_PAGE_SIZE]
+                if not page:
+                    break
+                names = await display_names(guild, page)
+                members = [(user_id, names[user_id]) for user_id in page if user_id in names]
+                cursor = page[-1]  # Skip pages whose users all left the guild
+        history = await attendance_store.member_history(guild.id, [member_id for member_id, _ in members], week_start)
+        return members, history, cursor
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == "csv":
+        writer.writerow(["user_id", "name", "cumulative", "week", "days"])
+        yield buffer.getvalue().encode("utf-8-sig")  # The BOM lets spreadsheets detect UTF-8 Korean names
+
+    cursor = None
+    while True:
+        members, history, cursor = asyncio.run_coroutine_threadsafe(fetch_page(cursor), loop).result()
+        if not members:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+        for member_id, name in members:
+            cumulative, weeks = history.get(member_id, (0, {}))
+            if file_format == "csv":
+                rows = [(member_id, name, cumulative, week, days) for week, days in weeks.items()]
+                writer.writerows(rows or [(member_id, name, cumulative, "", 0)])
+            else:
+                buffer.write(json.dumps(
+                    {"user_id": member_id, "name": name, "cumulative": cumulative, "weeks": weeks},
+                    ensure_ascii=False
+                ) + "\n")
+        yield buffer.getvalue().encode("utf-8")
+
+def build_weekly_report(members, user_attendance, cumulative_data, period):
+    """Builds the weekly report's pages of embeds. Runs on a report worker."""
+    # Report every member excluding bots in a single pass, defaulting to 0 if they didn't attend
+    fields = (
+        (
+            name,
+            f"📅 이번 주: {user_attendance.get(member_id, 0)}일\n📈 총 출석: {cumulative_data.get(member_id, 0)}일"
+        )
+        for member_id, name in members
+    )
+    return list(paginate_embeds(
+        fields,
+        title="📊 **주간 출석 통계**",
+        description=f"**기간:** {period}",
+        color=0x3498db,  # You can change the color code as desired
+        footer="출석 통계를 확인하세요!"
+    ))
+
+@timed("weekly_report")
+async def reset_attendance_and_report(guild):
+    """Processes the current attendance data, reports weekly statistics, and resets the weekly attendance."""
+    # Let the reactions still queued from the finished week be recorded before it is read.
+    # Under constant traffic the queue may never empty, so this only waits so long.
+    try:
+        await asyncio.wait_for(reaction_queue.join(), timeout=REACTION_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Reporting guild {guild.id} before the reaction queue drained")
+    # Load the previous week's and the cumulative attendance once, up front
+    now = get_current_time(guild_timezone(guild.id))
+    week_start = week_start_of(now.date()) - datetime.timedelta(days=7)
+    user_attendance = await attendance_store.weekly_counts(guild.id, week_start)
+    cumulative_data = await attendance_store.cumulative_counts(guild.id)
+    # Archive the finished week on a worker thread while the report is sent
+    masks = await attendance_store.week_masks(guild.id, week_start)
+    archived = asyncio.create_task(asyncio.to_thread(week_archive(guild.id).append, week_start, masks))
+
+    members = await listed_members(guild, cumulative_data.keys() | user_attendance.keys())
+    pages = await render_off_loop(
+        build_weekly_report, members, user_attendance, cumulative_data, get_start_end_dates_previous_week(now)
+    )
+
+    # Send the report to the guild's attendance channel, queueing every message in order
+    channel = get_board_channel(guild)
+    if channel:
+        await send_pages(f"messages:{channel.id}", PRIORITY_BOARD, channel.send, pages, "weekly report")
+    else:
+        print(f"Attendance channel for guild {guild.id} not found.")
+
+    try:
+        await archived
+    except OSError as e:
+        print(f"Failed to archive week {week_start} of guild {guild.id}: {e}")
 
-# Lock for managing concurrent access to the JSON files
-attendance_lock = asyncio.Lock()
+    # Reset the attendance data for the new week
+    await attendance_store.reset_week(guild.id, week_start + datetime.timedelta(days=7))
 
-# Variables for testing and tracking weeks
-test_time = None  # For testing purposes
-previous_week = None  # To store the previous week number
-weekly_message = None  # To store the latest weekly message
+@bot.event
+async def on_ready():
+    """Called when the bot is ready."""
+    global startup_done
+    print(f'Logged in as {bot.user}')
+    if startup_done:
+        return
+    startup_done = True
+    # Load attendance state; data from the single-guild layout is migrated into its guild if needed
+    legacy_id = legacy_guild_id()
+    attendance_store.load(legacy_guild_id=legacy_id)
+    rollover_states.load(legacy_guild_id=legacy_id)
+    attendance_store.start()  # Start flushing attendance changes to disk in the background
+    start_reaction_workers()
+    start_heartbeat()
+    await start_metrics_server()
+    for guild in bot.guilds:
+        if not LOW_MEMORY_MODE:
+            member_index(guild)  # Index each guild's members once; member events keep it current
+        guild_boards(guild)  # Pick up the boards posted before the restart
+        start_weekly_scheduler(guild.id)  # Start each guild's weekly rollover scheduler
+    # Sync the slash commands with Discord if they changed. A failure leaves the old commands in
+    # place; the fingerprint is not saved, so the next start tries again, as does /명령어동기화.
+    try:
+        await sync_commands(force=FORCE_COMMAND_SYNC)
+    except discord.HTTPException as e:
+        print(f"Failed to sync slash commands: {e}")
 
-def get_current_time():
-    """Returns the current time or the test time if set."""
-    if test_time:
-        return test_time
-    return datetime.datetime.now()
+def command_tree_fingerprint():
+    """Returns a stable hash of the registered slash commands: names, descriptions, parameters and permissions."""
+    commands = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: command["name"])
+    payload = json.dumps(
+        {"application_id": bot.application_id, "commands": commands},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-def get_start_end_dates_previous_week(now=None):
-    """Returns the start and end dates of the previous week."""
-    if now is None:
-        now = get_current_time()
-    start_date = now - datetime.timedelta(days=now.weekday() + 7)  # Last Monday
-    end_date = start_date + datetime.timedelta(days=6)  # Last Sunday
-    return f"{start_date.year}년 {start_date.month}월 {start_date.day}일 월요일 ~ {end_date.year}년 {end_date.month}월 {end_date.day}일 일요일"
+async def sync_commands(force=False):
+    """Syncs the slash commands with Discord unless they are unchanged since the last sync. Returns True if synced."""
+    fingerprint = command_tree_fingerprint()
+    if not force and read_json_file(COMMAND_SYNC_FILE, {}).get("fingerprint") == fingerprint:
+        print("Slash commands unchanged; skipping sync.")
+        return False
+    await tree.sync()
+    await asyncio.to_thread(write_json_file, COMMAND_SYNC_FILE, {"fingerprint": fingerprint})
+    return True
 
-async def load_attendance():
-    """Loads attendance data from the JSON file. Initializes the file if it doesn't exist."""
-    async with attendance_lock:
-        if not os.path.exists(ATTENDANCE_FILE):
-            # Initialize with empty lists for each day
-            attendance_data = {day: [] for day in weekdays_emojis.keys()}
-            with open(ATTENDANCE_FILE, "w", encoding="utf-8") as f:
-                json.dump(attendance_data, f, ensure_ascii=False, indent=4)
-            return attendance_data
-        else:
-            with open(ATTENDANCE_FILE, "r", encoding="utf-8") as f:
-                try:
-                    attendance_data = json.load(f)
-                except json.JSONDecodeError:
-                    # If JSON is corrupted, reinitialize
-                    attendance_data = {day: [] for day in weekdays_emojis.keys()}
-                    with open(ATTENDANCE_FILE, "w", encoding="utf-8") as fw:
-                        json.dump(attendance_data, fw, ensure_ascii=False, indent=4)
-                return attendance_data
-
-async def save_attendance(data):
-    """Saves attendance data to the JSON file."""
-    async with attendance_lock:
-        with open(ATTENDANCE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-
-async def load_cumulative_attendance():
-    """Loads cumulative attendance data from the JSON file. Initializes the file if it doesn't exist."""
-    async with attendance_lock:
-        if not os.path.exists(CUMULATIVE_ATTENDANCE_FILE):
-            cumulative_data = {}
-            with open(CUMULATIVE_ATTENDANCE_FILE, "w", encoding="utf-8") as f:
-                json.dump(cumulative_data, f, ensure_ascii=False, indent=4)
-            return cumulative_data
-        else:
-            with open(CUMULATIVE_ATTENDANCE_FILE, "r", encoding="utf-8") as f:
-                try:
-                    cumulative_data = json.load(f)
-                except json.JSONDecodeError:
-                    # If JSON is corrupted, reinitialize
-                    cumulative_data = {}
-                    with open(CUMULATIVE_ATTENDANCE_FILE, "w", encoding="utf-8") as fw:
-                        json.dump(cumulative_data, fw, ensure_ascii=False, indent=4)
-                return cumulative_data
-
-async def save_cumulative_attendance(data):
-    """Saves cumulative attendance data to the JSON file."""
-    async with attendance_lock:
-        with open(CUMULATIVE_ATTENDANCE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+@bot.event
+async def on_guild_join(guild):
+    """Indexes the members of a newly joined guild and starts its weekly rollover."""
+    if not LOW_MEMORY_MODE:
+        member_indexes[guild.id] = MemberIndex.build(guild)
+    start_weekly_scheduler(guild.id)
 
-async def reset_attendance_and_report(guild):
-    """Processes the current attendance data, reports weekly statistics, and resets the JSON file."""
-    attendance_data = await load_attendance()
+@bot.event
+async def on_guild_remove(guild):
+    """Stops the weekly rollover of a guild the bot left and drops its state."""
+    stop_weekly_scheduler(guild.id)
+    for board in boards.pop(guild.id, {}).values():
+        board.detach()
+    member_indexes.pop(guild.id, None)
+
+@bot.event
+async def on_member_join(member):
+    """Adds a new member to the guild's member index."""
+    index = member_indexes.get(member.guild.id)
+    if index is not None:
+        index.add(member)
 
-    # Dictionary to store user attendance counts for the week
-    user_attendance = {}
+@bot.event
+async def on_raw_member_remove(payload):
+    """Removes a departed member from the guild's member index, even if it was not cached."""
+    index = member_indexes.get(payload.guild_id)
+    if index is not None:
+        index.remove(payload.user.id)
 
-    # Iterate through each day and each user who attended
-    for day, users in attendance_data.items():
-        for user_id in users:
-            if user_id not in user_attendance:
-                user_attendance[user_id] = 0
-            user_attendance[user_id] += 1
+@bot.event
+async def on_member_update(before, after):
+    """Re-sorts a member whose server nickname changed."""
+    index = member_indexes.get(after.guild.id)
+    if index is not None:
+        index.add(after)
 
-    # Get all members in the guild excluding the bot
-    all_members = [member for member in guild.members if not member.bot]
+@bot.event
+async def on_user_update(before, after):
+    """Re-sorts a user whose global name changed in every guild that indexes them."""
+    for guild_id, index in member_indexes.items():
+        if after.id in index.names:
+            guild = bot.get_guild(guild_id)
+            member = guild.get_member(after.id) if guild else None
+            if member is not None:
+                index.add(member)
 
-    # Prepare the report with all members, defaulting to 0 if they didn't attend
+def build_board_embed(week_start, board_name=MAIN_BOARD):
+    """Builds the attendance check embed for the week starting on the given Monday."""
+    end_date = week_start + datetime.timedelta(days=6)
     embed = discord.Embed(
-        title="📊 **주간 출석 통계**",
-        description=f"**기간:** {get_start_end_dates_previous_week()}",
-        color=0x3498db  # You can change the color code as desired
+        title="📅 **출석 체크**" if board_name == MAIN_BOARD else f"📅 **출석 체크 - {board_name}**",
+        description=(
+            f"📆 **기간:** {week_start.year}년 {week_start.month}월 {week_start.day}일 월요일 ~ "
+            f"{end_date.year}년 {end_date.month}월 {end_date.day}일 일요일\n"
+            f"✅ 출석을 원하시는 요일에 해당하는 이모지로 반응해주세요."
+        ),
+        color=0x6ed9fa  # You can change the color code as desired
     )
     embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
-    embed.set_footer(text="출석 통계를 확인하세요!")
+    embed.set_footer(text="출석 체크를 통해 주간 및 누적 출석 통계를 확인하세요!")
+    return embed
 
-    for member in all_members:
-        weekly_count = user_attendance.get(str(member.id), 0)
-        # Retrieve cumulative_count from cumulative_data
-        cumulative_data = await load_cumulative_attendance()
-        cumulative_count = cumulative_data.get(str(member.id), 0)
-        embed.add_field(
-            name=member.display_name,
-            value=f"📅 이번 주: {weekly_count}일\n📈 총 출석: {cumulative_count}일",
-            inline=False
+async def save_rollover_state(guild_id, **weeks):
+    """Persists the Mondays of the guild's last reported week and/or last posted board."""
+    await rollover_states.update(guild_id, **{key: week.isoformat() for key, week in weeks.items()})
+
+def next_rollover(now):
+    """Returns the next Monday 00:00 after the given time, in its timezone."""
+    next_monday = week_start_of(now.date()) + datetime.timedelta(days=7)
+    return datetime.datetime.combine(next_monday, datetime.time(0), tzinfo=now.tzinfo)
+
+def read_last_alive():
+    """Returns when the bot was last known to be alive, or None if it never ran before."""
+    alive = read_json_file(HEARTBEAT_FILE, {}).get("alive")
+    return datetime.datetime.fromisoformat(alive) if alive else None
+
+def write_heartbeat():
+    """Records that the bot is alive now."""
+    write_json_file(HEARTBEAT_FILE, {"alive": datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+async def run_heartbeat():
+    while True:
+        try:
+            await asyncio.to_thread(write_heartbeat)
+        except OSError as e:
+            print(f"Failed to write heartbeat: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+def start_heartbeat():
+    """Reads when the previous run was last alive, then starts recording this run's heartbeat. Runs once."""
+    global last_alive, heartbeat_task
+    if heartbeat_task is None:
+        last_alive = read_last_alive()
+        heartbeat_task = asyncio.create_task(run_heartbeat())
+
+def emoji_key(emoji):
+    """Returns what identifies an emoji in reactions: its ID if it is custom, else its unicode name."""
+    if isinstance(emoji, str):
+        emoji = discord.PartialEmoji.from_str(emoji)
+    return emoji.id or emoji.name
+
+def usable_emoji(text):
+    """Returns whether the bot can react with the text: a custom emoji it can see, or a unicode emoji."""
+    emoji = discord.PartialEmoji.from_str(text)
+    if emoji.id:
+        return bot.get_emoji(emoji.id) is not None
+    if text[:1] in ("#", "*", *"0123456789") and text.endswith("\u20e3"):
+        return text[1:] in ("\u20e3", "\ufe0f\u20e3")  # A keycap such as #️⃣, whose base is ASCII punctuation or a digit
+    # Emoji sequences are symbols joined by variation selectors, keycaps and joiners, never letters or punctuation
+    categories = [unicodedata.category(char) for char in text]
+    return (
+        any(category in ("So", "Me") for category in categories)
+        and not any(category[0] in "LPZ" for category in categories)
+    )
+
+class Board:
+    """One attendance board of a guild: where it is posted, its weekday emojis and its current message.
+
+    Attendance on every board of a guild counts toward the same guild attendance, and the weekly
+    report is sent to the main board's channel.
+    """
+
+    def __init__(self, guild_id, name, channel_id, emojis):
+        self.guild_id = guild_id
+        self.name = name
+        self.channel_id = channel_id  # None for the main board, which follows /출석채널
+        self.emojis = list(emojis)  # Monday first
+        self.weekdays = {emoji_key(emoji): weekday for weekday, emoji in enumerate(self.emojis)}
+        self.message = None
+        self.week = None  # Monday of the week the current message is for
+
+    def channel(self, guild):
+        return guild.get_channel(self.channel_id) if self.channel_id else get_board_channel(guild)
+
+    def attach(self, message, week):
+        """Makes the message the board's current one, replacing the previous one in the dispatch index."""
+        self.detach()
+        self.message, self.week = message, week
+        board_messages[message.id] = self
+
+    def detach(self):
+        if self.message is not None and board_messages.get(self.message.id) is self:
+            del board_messages[self.message.id]
+
+def board_state(guild_id, name):
+    """Returns the persisted rollover state of one of the guild's boards."""
+    state = rollover_states.get(guild_id)
+    return state if name == MAIN_BOARD else state.get("boards", {}).get(name, {})
+
+async def save_board_state(guild_id, name, **updates):
+    """Persists rollover state of one of the guild's boards. The main board's lives at the top level."""
+    if name == MAIN_BOARD:
+        await rollover_states.update(guild_id, **updates)
+        return
+    states = {key: dict(value) for key, value in rollover_states.get(guild_id).get("boards", {}).items()}
+    states.setdefault(name, {}).update(updates)
+    await rollover_states.update(guild_id, boards=states)
+
+def guild_boards(guild):
+    """Returns the guild's boards by name, the main board first.
+
+    They are built from the guild config on first use, with their current messages restored from
+    the persisted channel and message IDs, without fetching them.
+    """
+    loaded = boards.get(guild.id)
+    if loaded is not None:
+        return loaded
+    loaded = boards[guild.id] = {MAIN_BOARD: Board(guild.id, MAIN_BOARD, None, weekdays_emojis.values())}
+    for name, config in guild_configs.get(guild.id).get("boards", {}).items():
+        loaded[name] = Board(guild.id, name, config["channel_id"], config["emojis"])
+    for board in loaded.values():
+        state = board_state(guild.id, board.name)
+        channel = guild.get_channel(state.get("board_channel_id") or 0)
+        if channel is not None and state.get("board_message_id"):
+            week = datetime.date.fromisoformat(state["board_week"]) if state.get("board_week") else None
+            board.attach(channel.get_partial_message(state["board_message_id"]), week)
+    return loaded
+
+async def set_board(guild, board, message, week_start):
+    """Makes the message the board's current one for the week and persists it across restarts."""
+    board.attach(message, week_start)
+    await save_board_state(
+        guild.id, board.name, board_week=week_start.isoformat(),
+        board_channel_id=message.channel.id, board_message_id=message.id
+    )
+
+async def reconcile_board(guild, since):
+    """Backfills attendance from reactions made on the guild's boards while the bot was down.
+
+    Only the boards' days from `since` up to today are considered, and a day's reaction users
+    are only paged through when its reaction count over every board exceeds the attendance
+    already recorded. Recording is idempotent per (user, date), so nothing is ever counted twice.
+    Reactions on days that have not come yet are removed, as they would have been if the bot was up.
+    """
+    tz = guild_timezone(guild.id)
+    today = get_current_time(tz).date()
+    reactors = {}  # date -> reactions on it over every board
+    days = []  # (message, reaction, date)
+    for board in list(guild_boards(guild).values()):
+        if board.message is None or board.week is None:
+            continue
+        first_day = max(board.week, since.astimezone(tz).date()) if since else board.week
+        try:
+            message = await board.message.fetch()  # One request for the reaction counts of every emoji
+        except discord.HTTPException as e:
+            print(f"Failed to fetch board {board.name} for reconciliation: {e}")
+            continue
+        reactions = {emoji_key(reaction.emoji): reaction for reaction in message.reactions}
+        for weekday, emoji in enumerate(board.emojis):
+            date = board.week + datetime.timedelta(days=weekday)
+            reaction = reactions.get(emoji_key(emoji))
+            if reaction is None or date < first_day:
+                continue
+            count = reaction.count - (1 if reaction.me else 0)
+            if count > 0:
+                reactors[date] = reactors.get(date, 0) + count
+                days.append((message, reaction, date))
+
+    recorded = 0
+    for message, reaction, date in days:
+        if date <= today and reactors[date] <= await attendance_store.day_count(guild.id, date):
+            continue  # Nothing was missed on this day
+        entries = []
+        async for user in reaction.users(limit=None):  # Pages through 100 users per request
+            if user.bot:
+                continue
+            if date > today:
+                remove_wrong_reaction(message.channel.id, message.id, reaction.emoji, user.id, guild.id)
+            else:
+                entries.append((user.id, date))
+        if entries:
+            recorded += await attendance_store.record_many(guild.id, entries)
+    if recorded:
+        print(f"Backfilled {recorded} missed attendance(s) in guild {guild.id}")
+
+async def post_weekly_board(guild, board, week_start):
+    """Posts a new weekly attendance message for one of the guild's boards.
+
+    Returns True if it was sent and False if sending failed. Returns None without trying if the
+    board has no channel; setting one with /출석채널 re-plans the rollover, so it is not retried.
+    """
+    channel = board.channel(guild)
+    if channel is None:
+        print(f"Channel of board {board.name} in guild {guild.id} not found; skipping it this week.")
+        return None
+    try:
+        message = await rest_scheduler.call(
+            f"messages:{channel.id}", PRIORITY_BOARD, channel.send, embed=build_board_embed(week_start, board.name)
         )
+    except discord.HTTPException as e:
+        print(f"Failed to send attendance message: {e}")
+        return False
+    await set_board(guild, board, message, week_start)
+    results = await asyncio.gather(*add_board_reactions(message, board.emojis), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Failed to add reaction: {result}")
+    return True
 
-    # Send the report to the designated channel
-    channel = bot.get_channel(channel_id)
-    if channel:
-        await channel.send(embed=embed)
-    else:
-        print(f"Channel with ID {channel_id} not found.")
+@timed("weekly_rollover")
+async def run_rollover(guild, now):
+    """Reports the guild's previous week and posts this week's board, unless already done for this week.
 
-    # Reset the attendance data for the new week
-    attendance_data = {day: [] for day in weekdays_emojis.keys()}
-    await save_attendance(attendance_data)
+    Returns the number of seconds after which it should run again.
+    """
+    week_start = week_start_of(now.date())
+    state = rollover_states.get(guild.id)
+    if "reported_week" not in state:
+        # First run: there is no previous week to report. Post a board only if the week starts today.
+        await save_rollover_state(guild.id, reported_week=week_start)
+        if now.weekday() != 0 and "board_week" not in state:
+            await save_rollover_state(guild.id, board_week=week_start)
+        state = rollover_states.get(guild.id)
 
-@bot.event
-async def on_ready():
-    """Called when the bot is ready."""
-    print(f'Logged in as {bot.user}')
-    await load_attendance()  # Ensure the attendance file is initialized
-    await load_cumulative_attendance()  # Ensure the cumulative attendance file is initialized
-    await tree.sync()  # Sync the slash commands with Discord
-    weekly_task.start()  # Start the weekly task
-
-@tasks.loop(seconds=10)  # Check every minute to reduce CPU usage
-async def weekly_task():
-    global weekly_message, previous_week
-    now = get_current_time()
-    current_week = now.isocalendar()[1]  # ISO week number
-
-    # Check if it's Monday and a new week has started
-    if now.weekday() == 0 and current_week != previous_week:
-        guild = bot.guilds[0]  # Assumes the bot is only in one guild
-        if previous_week is not None:
-            # Process and report the previous week's attendance before starting a new week
-            await reset_attendance_and_report(guild)
-
-        # Send the new weekly attendance message
-        channel = bot.get_channel(channel_id)
-        if channel is not None:
-            start_date = now
-            end_date = start_date + datetime.timedelta(days=6)
-            embed = discord.Embed(
-                title="📅 **출석 체크**",
-                description=(
-                    f"📆 **기간:** {start_date.year}년 {start_date.month}월 {start_date.day}일 월요일 ~ "
-                    f"{end_date.year}년 {end_date.month}월 {end_date.day}일 일요일\n"
-                    f"✅ 출석을 원하시는 요일에 해당하는 이모지로 반응해주세요."
-                ),
-                color=0x6ed9fa  # You can change the color code as desired
-            )
-            embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
-            embed.set_footer(text="출석 체크를 통해 주간 및 누적 출석 통계를 확인하세요!")
-            try:
-                weekly_message = await channel.send(embed=embed)
-                for name, emoji in weekdays_emojis.items():
-                    try:
-                        await weekly_message.add_reaction(emoji)
-                    except discord.HTTPException as e:
-                        print(f"Failed to add reaction: {e}")
-                previous_week = current_week
-            except discord.HTTPException as e:
-                print(f"Failed to send attendance message: {e}")
+    if datetime.date.fromisoformat(state["reported_week"]) < week_start:
+        # Process and report the previous week's attendance before starting a new week
+        await reset_attendance_and_report(guild)
+        await save_rollover_state(guild.id, reported_week=week_start)
+
+    failed = False
+    for board in list(guild_boards(guild).values()):
+        if datetime.date.fromisoformat(board_state(guild.id, board.name).get("board_week", "0001-01-01")) < week_start:
+            # Only a send that failed is retried soon; a board without a channel waits for the next week
+            if await post_weekly_board(guild, board, week_start) is False:
+                failed = True
+    if failed:
+        return ROLLOVER_RETRY_DELAY
 
-@weekly_task.before_loop
-async def before_weekly_task():
-    """Wait until the bot is ready before starting the weekly task."""
-    await bot.wait_until_ready()
+    # Compare in UTC so the sleep stays exact across DST transitions
+    utc = datetime.timezone.utc
+    return (next_rollover(now).astimezone(utc) - now.astimezone(utc)).total_seconds()
+
+async def weekly_scheduler(guild_id):
+    """Sleeps until the guild's next weekly rollover, or until it is asked to re-plan, and runs it."""
+    replan = rollover_replans.setdefault(guild_id, asyncio.Event())
+    guild = bot.get_guild(guild_id)
+    if guild is not None:
+        # Catch up on the boards before a rollover can report their week
+        try:
+            await reconcile_board(guild, last_alive)
+        except Exception as e:
+            print(f"Board reconciliation failed for guild {guild_id}: {e}")
+    while True:
+        replan.clear()
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            return  # The bot left the guild
+        try:
+            delay = await run_rollover(guild, get_current_time(guild_timezone(guild_id)))
+        except Exception as e:
+            print(f"Weekly rollover failed for guild {guild_id}: {e}")
+            delay = ROLLOVER_RETRY_DELAY
+        await clock.wait(replan, delay)
+
+def start_weekly_scheduler(guild_id):
+    """Starts the guild's weekly scheduler if it is not already running."""
+    task = weekly_scheduler_tasks.get(guild_id)
+    if task is None or task.done():
+        weekly_scheduler_tasks[guild_id] = asyncio.create_task(weekly_scheduler(guild_id))
+
+def stop_weekly_scheduler(guild_id):
+    """Stops the guild's weekly scheduler."""
+    task = weekly_scheduler_tasks.pop(guild_id, None)
+    if task is not None:
+        task.cancel()
+    rollover_replans.pop(guild_id, None)
+
+def replan_rollovers(guild_id=None):
+    """Wakes the weekly scheduler of one guild, or of every guild, to re-plan against the current time."""
+    for replan_guild_id, replan in rollover_replans.items():
+        if guild_id is None or replan_guild_id == guild_id:
+            replan.set()
 
 @bot.event
+@timed("on_raw_reaction_add")
 async def on_raw_reaction_add(payload):
-    """Handles reactions added to messages and updates cumulative attendance."""
-    global weekly_message
-    if weekly_message is None or payload.message_id != weekly_message.id:
-        return
+    """Queues reactions on a current board for the reaction workers and returns immediately."""
+    board = board_messages.get(payload.message_id)
+    if board is None:
+        return  # Not on a current board
+    if payload.user_id == bot.user.id:
+        return  # Ignore bot's own reactions
 
-    now = get_current_time()
-    current_weekday = now.weekday()  # 0 = Monday, 6 = Sunday
-    user_id = payload.user_id
+    # Capture the time now so the weekday is judged by when the reaction was made.
+    # The weekday the emoji stands for on this board is None if it is not one of its emojis.
+    item = (payload, get_current_time(guild_timezone(board.guild_id)), board.weekdays.get(emoji_key(payload.emoji)))
+    try:
+        reaction_queue.put_nowait(item)
+    except asyncio.QueueFull:
+        await reaction_queue.put(item)
 
-    if user_id == bot.user.id:
-        return  # Ignore bot's own reactions
+def start_reaction_workers():
+    """Starts the reaction workers if they are not already running."""
+    reaction_workers[:] = [task for task in reaction_workers if not task.done()]
+    while len(reaction_workers) < REACTION_WORKERS:
+        reaction_workers.append(asyncio.create_task(reaction_worker()))
 
-    # Get the day name based on the current weekday
-    day_names = list(weekdays_emojis.keys())
-    if current_weekday < 0 or current_weekday > 6:
-        print(f"Invalid current_weekday: {current_weekday}")
-        return
-    day_name = day_names[current_weekday]
-    expected_emoji = weekdays_emojis[day_name]
+async def reaction_worker():
+    """Drains the reaction queue in batches gathered over REACTION_BATCH_WINDOW."""
+    while True:
+        batch = [await reaction_queue.get()]
+        await asyncio.sleep(REACTION_BATCH_WINDOW)
+        while not reaction_queue.empty():
+            batch.append(reaction_queue.get_nowait())
+        try:
+            await process_reactions(batch)
+        except Exception as e:
+            print(f"Failed to process reactions: {e}")
+        finally:
+            for _ in batch:
+                reaction_queue.task_done()
 
-    if str(payload.emoji) != expected_emoji:
-        # Incorrect emoji reacted; remove the reaction
-        channel = bot.get_channel(payload.channel_id)
-        if channel is not None:
-            try:
-                message = await channel.fetch_message(payload.message_id)
-                guild = bot.guilds[0]  # Assumes the bot is only in one guild
-                member = guild.get_member(user_id) if guild else None
-                if member:
-                    await message.remove_reaction(payload.emoji, member)
-            except discord.Forbidden:
-                print(f"Permission error: Cannot remove reaction from user ID {user_id}")
-            except discord.HTTPException as e:
-                print(f"Failed to remove reaction: {e}")
-        return
+@timed("process_reactions")
+async def process_reactions(batch):
+    """Persists the correct reactions of a batch together and removes the wrong ones."""
+    attended = {}  # guild_id -> {(user_id, date)}
+    wrong = {}  # Duplicate wrong reactions in the same batch only need one removal
+    for payload, now, weekday in batch:
+        if weekday == now.weekday():
+            attended.setdefault(payload.guild_id, set()).add((payload.user_id, now.date()))
+        else:
+            wrong[(payload.channel_id, payload.message_id, payload.user_id, str(payload.emoji))] = payload
 
-    # Correct emoji reacted; update attendance
-    attendance_data = await load_attendance()
-    user_id_str = str(user_id)
-    if user_id_str not in attendance_data[day_name]:
-        attendance_data[day_name].append(user_id_str)
-        await save_attendance(attendance_data)
+    # Correct emoji reacted; update weekly and cumulative attendance
+    for guild_id, entries in attended.items():
+        await attendance_store.record_many(guild_id, entries)
 
-        # Load cumulative attendance data
-        cumulative_data = await load_cumulative_attendance()
+    # Incorrect emoji reacted; queue the removal behind interactive and board calls
+    for payload in wrong.values():
+        remove_wrong_reaction(payload.channel_id, payload.message_id, payload.emoji, payload.user_id, payload.guild_id)
 
-        # Update cumulative count
-        if user_id_str in cumulative_data:
-            cumulative_data[user_id_str] += 1
-        else:
-            cumulative_data[user_id_str] = 1
+def remove_wrong_reaction(channel_id, message_id, emoji, user_id, guild_id=None):
+    """Queues removal of a reaction through a partial message, without fetching the message or the member."""
+    channel = bot.get_partial_messageable(channel_id, guild_id=guild_id)
+    message = channel.get_partial_message(message_id)
+    future = rest_scheduler.submit(
+        f"reactions:{channel_id}", PRIORITY_CLEANUP,
+        message.remove_reaction, emoji, discord.Object(id=user_id)
+    )
+    future.add_done_callback(lambda f: report_removal_failure(f, user_id))
 
-        await save_cumulative_attendance(cumulative_data)
+def report_removal_failure(future, user_id):
+    """Logs a failed reaction removal."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if isinstance(error, discord.Forbidden):
+        print(f"Permission error: Cannot remove reaction from user ID {user_id}")
+    elif error is not None:
+        print(f"Failed to remove reaction: {error}")
 
 # === Slash Commands Section ===
 
 @tree.command(name="시간설정", description="디버깅을 위한 테스트 시간을 설정합니다.")
+@app_commands.guild_only()
 @app_commands.describe(year="연도", month="월", day="일", hour="시 (24시간)", minute="분", second="초")
 @app_commands.default_permissions(administrator=True)
 async def set_time(interaction: discord.Interaction, year: int, month: int, day: int, hour: int, minute: int, second: int):
     """Sets a test time for debugging purposes."""
-    global test_time
     # 응답을 연기하여 3초 이내에 응답하지 않더라도 시간이 충분히 주어지도록 함
     await interaction.response.defer(ephemeral=True)
     try:
-        test_time = datetime.datetime(year, month, day, hour, minute, second)
-        await interaction.followup.send(f"시간이 {test_time}으로 설정되었습니다.", ephemeral=True)
+        test_time = datetime.datetime(year, month, day, hour, minute, second, tzinfo=TIMEZONE)
+        set_clock(FixedClock(test_time))  # Also re-plans the weekly rollovers against the new time
+        await send_followup(interaction, f"시간이 {test_time}으로 설정되었습니다.", ephemeral=True)
     except ValueError as e:
-        await interaction.followup.send(f"잘못된 날짜 또는 시간: {e}", ephemeral=True)
+        await send_followup(interaction, f"잘못된 날짜 또는 시간: {e}", ephemeral=True)
 
 @tree.command(name="시간초기화", description="테스트 시간을 초기화하고 시스템의 현재 시간을 사용합니다.")
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 async def clear_time(interaction: discord.Interaction):
     """Clears the test time to use the system's current time."""
-    global test_time
     await interaction.response.defer(ephemeral=True)
-    test_time = None
-    await interaction.followup.send("시간 설정이 초기화되었습니다. 현재 시스템 시간을 사용합니다.", ephemeral=True)
+    set_clock(SystemClock())  # Also re-plans the weekly rollovers against the system time
+    await send_followup(interaction, "시간 설정이 초기화되었습니다. 현재 시스템 시간을 사용합니다.", ephemeral=True)
 
 @tree.command(name="누적출석", description="누적 출석 횟수를 표시합니다.")
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 async def show_cumulative(interaction: discord.Interaction):
     """Displays the cumulative attendance counts."""
     # 응답을 연기하여 시간이 오래 걸려도 오류가 발생하지 않도록 함
     await interaction.response.defer()
 
-    cumulative_data = await load_cumulative_attendance()
     guild = interaction.guild
-    all_members = [member for member in guild.members if not member.bot]
+    # Take the versions before reading, so a change made meanwhile is never cached as the old version
+    version = (attendance_store.version(guild.id), members_version(guild))
 
-    embed = discord.Embed(
+    async def build():
+        cumulative_data = await attendance_store.cumulative_counts(guild.id)
+        members = await listed_members(guild, cumulative_data.keys())
+        return await render_off_loop(build_cumulative_listing, members, cumulative_data)
+
+    pages = await listing_cache.render(("cumulative", guild.id), version, build)
+
+    # Sent in order, ahead of background calls
+    await send_pages(f"followup:{interaction.id}", PRIORITY_INTERACTIVE, interaction.followup.send, pages, "cumulative embed")
+
+def build_cumulative_listing(members, cumulative_data):
+    """Builds the /누적출석 pages of embeds. Runs on a report worker."""
+    fields = (
+        (name, f"📈 총 출석: {cumulative_data.get(member_id, 0)}일")
+        for member_id, name in members
+    )
+    return list(paginate_embeds(
+        fields,
         title="📈 **누적 출석 통계**",
         description="모든 멤버의 누적 출석 일수를 확인하세요.",
-        color=0x6ed9fa  # You can change the color code as desired
-    )
-    embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
-    embed.set_footer(text="누적 출석 통계를 확인하세요!")
-
-    for member in all_members:
-        cumulative_count = cumulative_data.get(str(member.id), 0)
-        embed.add_field(
-            name=member.display_name,
-            value=f"📈 총 출석: {cumulative_count}일",
-            inline=False
-        )
+        color=0x6ed9fa,  # You can change the color code as desired
+        footer="누적 출석 통계를 확인하세요!"
+    ))
 
-    # Discord Embed는 최대 25개의 필드만 지원하므로, 이를 고려하여 분할
-    fields = embed.fields
-    if len(fields) > 25:
-        for i in range(0, len(fields), 25):
-            partial_embed = discord.Embed(
-                title=embed.title,
-                description=embed.description,
-                color=embed.color
-            )
-            if embed.thumbnail.url:
-                partial_embed.set_thumbnail(url=embed.thumbnail.url)
-            partial_embed.set_footer(text=embed.footer.text)
-            for field in fields[i:i+25]:
-                partial_embed.add_field(name=field.name, value=field.value, inline=field.inline)
-            try:
-                await interaction.followup.send(embed=partial_embed)
-            except discord.HTTPException as e:
-                print(f"Failed to send cumulative embed: {e}")
-    else:
-        try:
-            await interaction.followup.send(embed=embed)
-        except discord.HTTPException as e:
-            print(f"Failed to send cumulative embed: {e}")
+@tree.command(name="출석내보내기", description="누적 및 주간 출석 기록을 파일로 내보냅니다.")
+@app_commands.guild_only()
+@app_commands.describe(file_format="파일 형식")
+@app_commands.choices(file_format=[
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSON Lines", value="jsonl"),
+])
+@app_commands.default_permissions(administrator=True)
+async def export_attendance(interaction: discord.Interaction, file_format: app_commands.Choice[str]):
+    """Streams the guild's cumulative and weekly attendance into a CSV or JSON lines attachment."""
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+    now = get_current_time(guild_timezone(guild.id))
+    loop = asyncio.get_running_loop()
+    stream = ExportStream(
+        lambda: export_chunks(guild, file_format.value, week_start_of(now.date()), loop),
+        name=f"attendance_{guild.id}_{now:%Y%m%d}.{file_format.value}"
+    )
+    try:
+        await send_followup(interaction, "출석 기록을 내보냈습니다.", file=discord.File(stream), ephemeral=True)
+    except discord.HTTPException as e:
+        await send_followup(interaction, f"출석 기록 내보내기에 실패했습니다: {e}", ephemeral=True)
+    finally:
+        stream.close()
 
 @tree.command(name="출석생성", description="요일 이모지와 함께 새로운 출석 체크 메시지를 생성합니다.")
+@app_commands.guild_only()
+@app_commands.describe(board="출석 보드 이름 (기본: 기본 보드)")
 @app_commands.default_permissions(administrator=True)
-async def create_attendance_message(interaction: discord.Interaction):
+async def create_attendance_message(interaction: discord.Interaction, board: str = MAIN_BOARD):
     """Creates a new attendance check message with weekday emojis."""
-    global weekly_message, previous_week
     # 응답을 연기하여 시간이 오래 걸려도 오류가 발생하지 않도록 함
     await interaction.response.defer(ephemeral=True)
-    now = get_current_time()
-    start_date = now - datetime.timedelta(days=now.weekday())  # This week's Monday
-    end_date = start_date + datetime.timedelta(days=6)  # This week's Sunday
+    guild = interaction.guild
+    week_start = week_start_of(get_current_time(guild_timezone(guild.id)).date())  # This week's Monday
 
-    channel = bot.get_channel(channel_id)
+    target = guild_boards(guild).get(board)
+    if target is None:
+        await send_followup(interaction, f"출석 보드 {board}을(를) 찾을 수 없습니다.", ephemeral=True)
+        return
+    channel = target.channel(guild)
     if channel is None:
-        await interaction.followup.send(f"채널 ID {channel_id}을(를) 찾을 수 없습니다.", ephemeral=True)
+        await send_followup(interaction, "출석 채널을 찾을 수 없습니다. /출석채널 명령어로 채널을 설정해주세요.", ephemeral=True)
         return
 
     # Attendance Check Embed Message
-    embed = discord.Embed(
-        title="📅 **출석 체크**",
-        description=(
-            f"📆 **기간:** {start_date.year}년 {start_date.month}월 {start_date.day}일 월요일 ~ "
-            f"{end_date.year}년 {end_date.month}월 {end_date.day}일 일요일\n"
-            f"✅ 출석을 원하시는 요일에 해당하는 이모지로 반응해주세요."
-        ),
-        color=0x6ed9fa  # You can change the color code as desired
-    )
-    embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
-    embed.set_footer(text="출석 체크를 통해 주간 및 누적 출석 통계를 확인하세요!")
+    embed = build_board_embed(week_start, target.name)
     try:
-        weekly_message = await channel.send(embed=embed)
-        for emoji in weekdays_emojis.values():
-            await weekly_message.add_reaction(emoji)
-        previous_week = now.isocalendar()[1]
+        message = await rest_scheduler.call(f"messages:{channel.id}", PRIORITY_BOARD, channel.send, embed=embed)
+        await set_board(guild, target, message, week_start)
+        await asyncio.gather(*add_board_reactions(message, target.emojis))
         # Send a success message to the user via DM
-        await interaction.followup.send("출석 체크 메시지가 성공적으로 생성되었습니다.", ephemeral=True)
+        await send_followup(interaction, "출석 체크 메시지가 성공적으로 생성되었습니다.", ephemeral=True)
     except discord.HTTPException as e:
         try:
-            await interaction.followup.send(f"메시지 생성에 실패했습니다: {e}", ephemeral=True)
+            await send_followup(interaction, f"메시지 생성에 실패했습니다: {e}", ephemeral=True)
         except discord.Forbidden:
-            await interaction.followup.send("DM을 보낼 수 없습니다. 봇이 메시지를 보낼 수 있도록 설정해주세요.", ephemeral=True)
+            await send_followup(interaction, "DM을 보낼 수 없습니다. 봇이 메시지를 보낼 수 있도록 설정해주세요.", ephemeral=True)
 
 @tree.command(name="출석설정", description="특정 메시지 ID를 현재 출석 체크 메시지로 설정합니다.")
-@app_commands.describe(message_id="설정할 메시지의 ID")
+@app_commands.guild_only()
+@app_commands.describe(message_id="설정할 메시지의 ID", board="출석 보드 이름 (기본: 기본 보드)")
 @app_commands.default_permissions(administrator=True)
-async def set_attendance_message(interaction: discord.Interaction, message_id: int):
+async def set_attendance_message(interaction: discord.Interaction, message_id: int, board: str = MAIN_BOARD):
     """Sets a specific message ID as the current attendance check message."""
-    global weekly_message, previous_week
     # 응답을 연기하여 시간이 오래 걸려도 오류가 발생하지 않도록 함
     await interaction.response.defer(ephemeral=True)
-    channel = bot.get_channel(channel_id)
+    guild = interaction.guild
+    target = guild_boards(guild).get(board)
+    if target is None:
+        await send_followup(interaction, f"출석 보드 {board}을(를) 찾을 수 없습니다.", ephemeral=True)
+        return
+    channel = target.channel(guild)
     if channel is None:
-        await interaction.followup.send(f"채널 ID {channel_id}을(를) 찾을 수 없습니다.", ephemeral=True)
+        await send_followup(interaction, "출석 채널을 찾을 수 없습니다. /출석채널 명령어로 채널을 설정해주세요.", ephemeral=True)
         return
 
     try:
         message = await channel.fetch_message(message_id)
     except discord.NotFound:
-        await interaction.followup.send(f"메시지 ID {message_id}을(를) 찾을 수 없습니다.", ephemeral=True)
+        await send_followup(interaction, f"메시지 ID {message_id}을(를) 찾을 수 없습니다.", ephemeral=True)
         return
     except discord.HTTPException as e:
-        await interaction.followup.send(f"메시지 가져오기 중 오류가 발생했습니다: {e}", ephemeral=True)
+        await send_followup(interaction, f"메시지 가져오기 중 오류가 발생했습니다: {e}", ephemeral=True)
         return
 
     # Check if the message has all required emojis
-    for emoji in weekdays_emojis.values():
-        if not any(str(reaction.emoji) == emoji for reaction in message.reactions):
-            await interaction.followup.send("메시지에 모든 요일 이모지가 추가되어 있지 않습니다.", ephemeral=True)
+    reacted = {emoji_key(reaction.emoji) for reaction in message.reactions}
+    if not reacted.issuperset(target.weekdays):
+        await send_followup(interaction, "메시지에 모든 요일 이모지가 추가되어 있지 않습니다.", ephemeral=True)
+        return
+
+    await set_board(guild, target, message, week_start_of(get_current_time(guild_timezone(guild.id)).date()))
+    await send_followup(interaction, f"메시지 ID {message_id}을(를) 현재 주의 출석 체크 메시지로 설정했습니다.", ephemeral=True)
+
+@tree.command(name="출석채널", description="이 서버의 출석 체크 메시지를 보낼 채널과 시간대를 설정합니다.")
+@app_commands.guild_only()
+@app_commands.describe(channel="출석 체크 메시지를 보낼 채널", timezone="주가 시작되는 시간대 (예: Asia/Seoul)")
+@app_commands.default_permissions(administrator=True)
+async def set_attendance_channel(interaction: discord.Interaction, channel: discord.TextChannel, timezone: str = None):
+    """Sets the guild's attendance channel and, optionally, the timezone in which its weeks start."""
+    await interaction.response.defer(ephemeral=True)
+    updates = {"channel_id": channel.id}
+    if timezone is not None:
+        try:
+            ZoneInfo(timezone)
+        except (ValueError, KeyError):  # ZoneInfoNotFoundError is a KeyError
+            await send_followup(interaction, f"알 수 없는 시간대입니다: {timezone}", ephemeral=True)
             return
+        updates["timezone"] = timezone
+    await guild_configs.update(interaction.guild_id, **updates)
+    replan_rollovers(interaction.guild_id)  # The next rollover may move with the timezone
+    await send_followup(interaction, f"출석 채널을 {channel.mention}(으)로 설정했습니다.", ephemeral=True)
+
+@tree.command(name="출석보드추가", description="자체 채널과 요일 이모지를 가진 출석 보드를 추가합니다.")
+@app_commands.guild_only()
+@app_commands.describe(
+    name="보드 이름", channel="출석 체크 메시지를 보낼 채널",
+    emojis="월요일부터 일요일까지의 이모지 7개, 공백으로 구분 (기본: 기본 보드와 같음)"
+)
+@app_commands.default_permissions(administrator=True)
+async def add_board(interaction: discord.Interaction, name: app_commands.Range[str, 1, 32], channel: discord.TextChannel, emojis: str = None):
+    """Adds a board with its own channel and weekday emojis and posts this week's message for it."""
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+    current = guild_boards(guild)
+    if name in current:
+        await send_followup(interaction, f"출석 보드 {name}이(가) 이미 있습니다.", ephemeral=True)
+        return
+    emoji_list = emojis.split() if emojis else list(weekdays_emojis.values())
+    if len(emoji_list) != 7 or len({emoji_key(emoji) for emoji in emoji_list}) != 7:
+        await send_followup(interaction, "요일 이모지는 서로 다른 7개를 입력해주세요.", ephemeral=True)
+        return
+    unusable = [emoji for emoji in emoji_list if not usable_emoji(emoji)] if emojis else []  # The defaults are the main board's
+    if unusable:
+        await send_followup(interaction, f"봇이 사용할 수 없는 이모지입니다: {' '.join(unusable)}", ephemeral=True)
+        return
+
+    configs = {key: dict(value) for key, value in guild_configs.get(guild.id).get("boards", {}).items()}
+    configs[name] = {"channel_id": channel.id, "emojis": emoji_list}
+    await guild_configs.update(guild.id, boards=configs)
+    board = current[name] = Board(guild.id, name, channel.id, emoji_list)
 
-    weekly_message = message
-    previous_week = get_current_time().isocalendar()[1]
-    await interaction.followup.send(f"메시지 ID {message_id}을(를) 현재 주의 출석 체크 메시지로 설정했습니다.", ephemeral=True)
+    week_start = week_start_of(get_current_time(guild_timezone(guild.id)).date())
+    posted = await post_weekly_board(guild, board, week_start)
+    if posted:
+        await send_followup(interaction, f"출석 보드 {name}을(를) {channel.mention}에 추가했습니다.", ephemeral=True)
+    elif posted is None:
+        await send_followup(
+            interaction,
+            f"출석 보드 {name}을(를) 추가했지만 채널을 찾을 수 없어 출석 체크 메시지를 보내지 못했습니다.", ephemeral=True
+        )
+    else:
+        replan_rollovers(guild.id)  # Only a failed send is retried by the scheduler
+        await send_followup(
+            interaction,
+            f"출석 보드 {name}을(를) 추가했지만 출석 체크 메시지를 보내지 못했습니다. 잠시 후 다시 시도합니다.", ephemeral=True
+        )
+
+@tree.command(name="출석보드삭제", description="추가한 출석 보드를 삭제합니다. 기록된 출석은 유지됩니다.")
+@app_commands.guild_only()
+@app_commands.describe(name="삭제할 보드 이름")
+@app_commands.default_permissions(administrator=True)
+async def remove_board(interaction: discord.Interaction, name: str):
+    """Removes an added board. Its message is left in place but no longer counts reactions."""
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+    if name == MAIN_BOARD:
+        await send_followup(interaction, "기본 출석 보드는 삭제할 수 없습니다.", ephemeral=True)
+        return
+    board = guild_boards(guild).pop(name, None)
+    if board is None:
+        await send_followup(interaction, f"출석 보드 {name}을(를) 찾을 수 없습니다.", ephemeral=True)
+        return
+    board.detach()
+    configs = {key: dict(value) for key, value in guild_configs.get(guild.id).get("boards", {}).items() if key != name}
+    await guild_configs.update(guild.id, boards=configs)
+    states = {key: dict(value) for key, value in rollover_states.get(guild.id).get("boards", {}).items() if key != name}
+    await rollover_states.update(guild.id, boards=states)
+    await send_followup(interaction, f"출석 보드 {name}을(를) 삭제했습니다.", ephemeral=True)
+
+@tree.command(name="출석보드목록", description="이 서버의 출석 보드를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def list_boards(interaction: discord.Interaction):
+    """Lists the guild's boards with their channels, emojis and current weeks."""
+    await interaction.response.defer(ephemeral=True)
+    guild = interaction.guild
+    embed = discord.Embed(title="📋 **출석 보드**", color=0x6ed9fa)
+    for board in guild_boards(guild).values():
+        channel = board.channel(guild)
+        week = f"{board.week} 주" if board.week else "게시된 메시지 없음"
+        embed.add_field(
+            name=board.name,
+            value=f"{channel.mention if channel else '채널 없음'} · {week}\n{' '.join(board.emojis)}",
+            inline=False
+        )
+    embed.set_footer(text="/출석보드추가, /출석보드삭제로 보드를 관리하세요.")
+    await send_followup(interaction, embed=embed, ephemeral=True)
+
+@tree.command(name="명령어동기화", description="슬래시 명령어를 Discord와 강제로 동기화합니다.")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def force_sync_commands(interaction: discord.Interaction):
+    """Forces a slash command sync, e.g. after the commands were changed on Discord's side."""
+    await interaction.response.defer(ephemeral=True)
+    try:
+        await sync_commands(force=True)
+    except discord.HTTPException as e:
+        await send_followup(interaction, f"명령어 동기화에 실패했습니다: {e}", ephemeral=True)
+        return
+    await send_followup(interaction, "슬래시 명령어를 동기화했습니다.", ephemeral=True)
 
 @tree.command(name="내출석", description="본인의 누적 출석 횟수를 확인합니다.")
+@app_commands.guild_only()
 async def my_attendance(interaction: discord.Interaction):
     """Displays the cumulative attendance count for the user."""
     await interaction.response.defer(ephemeral=True)  # 응답 지연 및 에페멀 설정
 
-    cumulative_data = await load_cumulative_attendance()
-    user_id_str = str(interaction.user.id)
-    cumulative_count = cumulative_data.get(user_id_str, 0)
+    user = interaction.user
+    avatar_url = user.avatar.url if user.avatar else None
+    cache_key = ("mine", interaction.guild_id, user.id)
+    version = (attendance_store.version(interaction.guild_id), user.display_name, avatar_url)
+    embed = embed_cache.get(cache_key, version)
+    if embed is None:
+        embed = await build_my_attendance_embed(interaction.guild_id, user, avatar_url)
+        embed_cache.put(cache_key, version, embed)
+
+    # 에페멀 응답으로 임베드 전송
+    await send_followup(interaction, embed=embed, ephemeral=True)
+
+async def build_my_attendance_embed(guild_id, user, avatar_url):
+    """Builds the /내출석 embed for the user."""
+    cumulative_count = await attendance_store.cumulative_count(guild_id, user.id)
 
     # 임베드 메시지 생성
     embed = discord.Embed(
@@ -431,10 +2791,10 @@ async def my_attendance(interaction: discord.Interaction):
         description="당신의 누적 출석 일수를 확인하세요.",
         color=0x6ed9fa  # 원하는 색상 코드로 변경 가능
     )
-    embed.set_thumbnail(url=interaction.user.avatar.url if interaction.user.avatar else None)
+    embed.set_thumbnail(url=avatar_url)
     embed.add_field(
         name="👤 사용자",
-        value=interaction.user.display_name,
+        value=user.display_name,
         inline=False
     )
     embed.add_field(
@@ -443,12 +2803,259 @@ async def my_attendance(interaction: discord.Interaction):
         inline=False
     )
     embed.set_footer(text="출석 통계를 확인하세요!")
+    return embed
 
-    # 에페멀 응답으로 임베드 전송
-    await interaction.followup.send(embed=embed, ephemeral=True)
+@tree.command(name="순위", description="누적 출석 순위를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.describe(count="표시할 순위 수")
+async def show_ranking(interaction: discord.Interaction, count: app_commands.Range[int, 1, 50] = 10):
+    """Displays the members with the most cumulative attendance, and the caller's own rank."""
+    await interaction.response.defer()
+
+    guild = interaction.guild
+    top = await attendance_store.top_ranked(guild.id, count)
+    rank, my_count, ranked = await attendance_store.rank_of(guild.id, interaction.user.id)
+    names = await display_names(guild, [user_id for user_id, _ in top])
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+    lines = []
+    previous_count, position = None, 0
+    for index, (user_id, user_count) in enumerate(top, start=1):
+        if user_count != previous_count:
+            previous_count, position = user_count, index  # Ties share a rank
+        name = names.get(user_id) or f"<@{user_id}>"
+        lines.append(f"{medals.get(position, f'**{position}.**')} {name} — {user_count}일")
+
+    embed = discord.Embed(
+        title="🏆 **누적 출석 순위**",
+        description="\n".join(lines) or "아직 출석 기록이 없습니다.",
+        color=0xf1c40f
+    )
+    embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
+    if rank is None:
+        my_rank = "아직 출석 기록이 없습니다."
+    else:
+        my_rank = f"{rank}위 / {ranked}명 ({my_count}일)"
+    embed.add_field(name="👤 나의 순위", value=my_rank, inline=False)
+    embed.set_footer(text="출석 통계를 확인하세요!")
+
+    await send_followup(interaction, embed=embed)
+
+def member_streaks(attendance_days, user_id, start, today):
+    """Returns the user's attended days from start to today, current streak and longest streak."""
+    return (
+        attendance_days.attended_days(user_id, start, today),
+        attendance_days.current_streak(user_id, today),
+        attendance_days.longest_streak(user_id),
+    )
+
+@tree.command(name="출석통계", description="연속 출석과 출석률을 확인합니다.")
+@app_commands.guild_only()
+@app_commands.describe(member="확인할 멤버 (기본: 본인)", days="출석률을 계산할 기간 (일)")
+async def show_member_stats(interaction: discord.Interaction, member: discord.Member = None, days: app_commands.Range[int, 1, 3650] = 28):
+    """Displays a member's current and longest streaks and attendance rate over the last days."""
+    await interaction.response.defer(ephemeral=True)
+    member = member or interaction.user
+    today = get_current_time(guild_timezone(interaction.guild_id)).date()
+    attendance_days = (await attendance_store.attendance_days(interaction.guild_id)).snapshot([member.id])
+    attended, current_streak, longest_streak = await render_off_loop(
+        member_streaks, attendance_days, member.id, today - datetime.timedelta(days=days - 1), today
+    )
+
+    embed = discord.Embed(
+        title="📊 **출석 통계**",
+        description=f"{member.display_name}님의 출석 기록입니다.",
+        color=0x6ed9fa
+    )
+    embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
+    embed.add_field(name="🔥 현재 연속 출석", value=f"{current_streak}일", inline=True)
+    embed.add_field(name="🏅 최장 연속 출석", value=f"{longest_streak}일", inline=True)
+    embed.add_field(name=f"📅 최근 {days}일 출석률", value=f"{attended}/{days}일 ({attended / days:.0%})", inline=False)
+    embed.set_footer(text="출석 통계를 확인하세요!")
+    await send_followup(interaction, embed=embed, ephemeral=True)
+
+@tree.command(name="요일통계", description="서버 전체의 요일별 출석 분포를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.describe(weeks="집계할 기간 (주)")
+async def show_weekday_stats(interaction: discord.Interaction, weeks: app_commands.Range[int, 1, 520] = 12):
+    """Displays the guild's average attendance per weekday over the last weeks, this week included."""
+    await interaction.response.defer()
+    today = get_current_time(guild_timezone(interaction.guild_id)).date()
+    start = week_start_of(today) - datetime.timedelta(weeks=weeks - 1)
+    attendance_days = (await attendance_store.attendance_days(interaction.guild_id)).snapshot()
+    totals = await render_off_loop(attendance_days.weekday_totals, start, today)
+
+    lines = []
+    for weekday, emoji in enumerate(weekdays_emojis.values()):
+        # Days of this weekday in the window; this week's later days have not happened yet
+        occurrences = weeks - (1 if weekday > today.weekday() else 0)
+        average = totals[weekday] / occurrences if occurrences else 0
+        lines.append(f"{emoji} 평균 {average:.1f}명 (총 {totals[weekday]}회)")
+
+    embed = discord.Embed(
+        title="📅 **요일별 출석 통계**",
+        description=f"**기간:** {start} ~ {today}\n\n" + "\n".join(lines),
+        color=0x3498db
+    )
+    embed.set_thumbnail(url=bot.user.avatar.url if bot.user.avatar else None)
+    embed.set_footer(text="출석 통계를 확인하세요!")
+    await send_followup(interaction, embed=embed)
+
+@tree.command(name="메트릭", description="봇의 처리 시간, 락 대기, 디스크 I/O, REST 통계를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+async def show_metrics(interaction: discord.Interaction):
+    """Summarizes the collected metrics for admins."""
+    await interaction.response.defer(ephemeral=True)
+
+    def field_lines(lines):
+        text = "\n".join(lines) or "기록 없음"
+        return text if len(text) <= FIELD_VALUE_MAX else text[:FIELD_VALUE_MAX - 1] + "…"
+
+    def latency_lines(name, label):
+        histograms = sorted(
+            ((dict(labels)[label], histogram) for (metric, labels), histogram in list(metrics.histograms.items()) if metric == name),
+            key=lambda item: -item[1].count
+        )
+        return [
+            f"{value}: {histogram.count}회, p50 ≤{histogram.quantile(0.5) * 1000:g}ms, p99 ≤{histogram.quantile(0.99) * 1000:g}ms"
+            for value, histogram in histograms
+        ]
+
+    def byte_lines(name):
+        totals = {}
+        for (metric, labels), value in list(metrics.counters.items()):
+            if metric == name:
+                totals[dict(labels)["file"]] = value
+        return [f"{file}: {value / 1024:.1f} KiB" for file, value in sorted(totals.items(), key=lambda item: -item[1])]
+
+    rest_wait = metrics.histograms.get(("toha_rest_wait_seconds", ()))
+    embed = discord.Embed(title="📟 **봇 메트릭**", color=0x95a5a6)
+    embed.add_field(name="⏱️ 핸들러 처리 시간", value=field_lines(
+        latency_lines("toha_handler_seconds", "handler") + latency_lines("toha_command_seconds", "command")
+    ), inline=False)
+    embed.add_field(name="🔒 락 대기", value=field_lines([
+        f"{name}: {wait.count}회, 합계 {wait.total * 1000:.0f}ms, 최대 {wait.max * 1000:.0f}ms"
+        for name, wait in lock_wait_stats.items()
+    ]), inline=False)
+    embed.add_field(name="💾 디스크 쓰기", value=field_lines(byte_lines("toha_disk_write_bytes_total")), inline=True)
+    embed.add_field(name="📂 디스크 읽기", value=field_lines(byte_lines("toha_disk_read_bytes_total")), inline=True)
+    embed.add_field(name="🌐 REST", value=(
+        f"완료 {metrics.total('toha_rest_completed_total')}회, 실패 {metrics.total('toha_rest_failed_total')}회, "
+        f"재시도 {metrics.total('toha_rest_retries_total')}회\n"
+        f"429 {metrics.total('toha_rest_rate_limited_total')}회, 대기 중 {rest_scheduler.depth()}건, "
+        f"대기 p99 ≤{rest_wait.quantile(0.99) if rest_wait else 0:g}초"
+    ), inline=False)
+    embed.add_field(name="📥 반응 대기열", value=f"{reaction_queue.qsize()}건", inline=False)
+    await send_followup(interaction, embed=embed, ephemeral=True)
+
+@tree.command(name="출석기록", description="지난 주의 특정 날짜에 출석한 멤버를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.describe(date="날짜 (예: 2026-03-04)")
+@app_commands.default_permissions(administrator=True)
+async def show_archived_day(interaction: discord.Interaction, date: str):
+    """Lists the members who attended on a date of an archived week."""
+    # Errors are answered before deferring, as a public deferral would make them public too
+    try:
+        day = datetime.date.fromisoformat(date)
+    except ValueError:
+        await interaction.response.send_message(f"잘못된 날짜입니다: {date}", ephemeral=True)
+        return
+
+    year, week, weekday = day.isocalendar()
+    weeks = await asyncio.to_thread(week_archive(interaction.guild_id).read_weeks, [(year, week)])
+    if (year, week) not in weeks:
+        await interaction.response.send_message(f"{day}이(가) 속한 주의 기록이 없습니다.", ephemeral=True)
+        return
+    await interaction.response.defer()
+    attendee_ids = [user_id for user_id, mask in weeks[(year, week)].items() if mask & (1 << (weekday - 1))]
+    names = await display_names(interaction.guild, attendee_ids)
+    attendees = [names.get(user_id) or f"<@{user_id}>" for user_id in attendee_ids]
+
+    # Pack the names into as few fields as the field value limit allows
+    fields, chunk = [], ""
+    for name in attendees:
+        if chunk and len(chunk) + 2 + len(name) > FIELD_VALUE_MAX:
+            fields.append(("👥 출석자", chunk))
+            chunk = ""
+        chunk = f"{chunk}, {name}" if chunk else name
+    if chunk:
+        fields.append(("👥 출석자", chunk))
+    pages = paginate_embeds(
+        fields,
+        title=f"📅 **{day} 출석 기록**",
+        description=f"총 {len(attendees)}명이 출석했습니다.",
+        color=0x3498db,
+        footer="출석 통계를 확인하세요!"
+    )
+    await send_pages(
+        f"followup:{interaction.id}", PRIORITY_INTERACTIVE, interaction.followup.send, pages, "archived attendance"
+    )
+
+@tree.command(name="기간출석", description="지난 주들의 기간별 출석 일수를 확인합니다.")
+@app_commands.guild_only()
+@app_commands.describe(year="ISO 연도", from_week="시작 주 (ISO 주 번호)", to_week="끝 주 (ISO 주 번호)")
+@app_commands.default_permissions(administrator=True)
+async def show_archived_weeks(
+    interaction: discord.Interaction, year: int,
+    from_week: app_commands.Range[int, 1, 53], to_week: app_commands.Range[int, 1, 53]
+):
+    """Displays how many days each member attended over a range of archived ISO weeks."""
+    # Errors are answered before deferring, as a public deferral would make them public too
+    try:
+        first_day, last_day = iso_week_start(year, from_week), iso_week_start(year, to_week) + datetime.timedelta(days=6)
+    except ValueError:
+        await interaction.response.send_message(f"{year}년에는 해당 주가 없습니다.", ephemeral=True)
+        return
+    weeks = await asyncio.to_thread(
+        week_archive(interaction.guild_id).read_weeks, [(year, week) for week in range(from_week, to_week + 1)]
+    )
+    if not weeks:
+        await interaction.response.send_message(f"{year}년 {from_week}~{to_week}주의 기록이 없습니다.", ephemeral=True)
+        return
+    await interaction.response.defer()
+
+    totals = {}
+    for masks in weeks.values():
+        for user_id, mask in masks.items():
+            totals[user_id] = totals.get(user_id, 0) + count_bits(mask)
+    names = await display_names(interaction.guild, totals.keys())
+    fields = (
+        (names.get(user_id) or str(user_id), f"📅 {days}일")
+        for user_id, days in sorted(totals.items(), key=lambda item: -item[1])
+    )
+    pages = paginate_embeds(
+        fields,
+        title=f"📊 **{year}년 {from_week}~{to_week}주 출석 통계**",
+        description=f"**기간:** {first_day} ~ {last_day} (기록된 주 {len(weeks)}개)",
+        color=0x3498db,
+        footer="출석 통계를 확인하세요!"
+    )
+    await send_pages(
+        f"followup:{interaction.id}", PRIORITY_INTERACTIVE, interaction.followup.send, pages, "archived attendance"
+    )
 
 # === Slash Commands Section End ===
 
+def record_command(interaction, failed=False):
+    """Records a finished slash command's latency, and counts it as failed if it raised."""
+    started = command_started.pop(interaction.id, None)
+    name = interaction.command.qualified_name if interaction.command else "unknown"
+    if failed:
+        metrics.count("toha_command_errors_total", command=name)
+    if started is not None:
+        metrics.observe("toha_command_seconds", time.perf_counter() - started, command=name)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command(interaction)
+
+@tree.error
+async def on_tree_error(interaction: discord.Interaction, error):
+    """Records a failed slash command and hands it to the global error handler."""
+    record_command(interaction, failed=True)
+    await on_app_command_error(interaction, error)
+
 @bot.event
 async def on_app_command_error(interaction: discord.Interaction, error):
     """Global error handler for application commands."""
@@ -459,10 +3066,45 @@ async def on_app_command_error(interaction: discord.Interaction, error):
         # 다른 오류는 콘솔에 로그
         print(f"Unhandled error: {error}")
 
+async def serve_metrics(request):
+    # Queue depths are only sampled when scraped
+    metrics.set("toha_rest_queue_depth", rest_scheduler.depth())
+    metrics.set("toha_reaction_queue_depth", reaction_queue.qsize())
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def start_metrics_server():
+    """Serves /metrics on METRICS_HOST:METRICS_PORT if a port is configured."""
+    if not METRICS_PORT:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    except OSError as e:
+        print(f"Failed to start metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+        await runner.cleanup()
+        return
+    print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+async def setup_hook():
+    """Closes the bot on SIGTERM (docker stop, systemd), as Client.run only handles Ctrl+C."""
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass  # Event loops on Windows have no signal handlers
+
+bot.setup_hook = setup_hook
+
 # Load the Discord bot token from environment variables
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')  # Ensure this environment variable is set
 
 if TOKEN is None:
     print("Error: DISCORD_BOT_TOKEN 환경 변수가 설정되지 않았습니다.")
 else:
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        attendance_store.close()  # Persist any attendance changes still pending at shutdown
+        write_heartbeat()